@@ -11,6 +11,8 @@ command -v rapper >/dev/null 2>&1 || { echo >&2 "rapper is not available, aborti
 export WARSA_ENDPOINT_URL=${WARSA_ENDPOINT_URL:-http://localhost:3030/warsa}
 export ARPA_URL=${ARPA_URL:-http://demo.seco.tkk.fi/arpa}
 export LOG_LEVEL="DEBUG"
+# Responses of Warsa and ARPA queries are reused for a week between runs. Add --replay to rerun offline.
+export RESPONSE_CACHE="--response-cache output/responses.sqlite --cache-ttl ${RESPONSE_CACHE_TTL:-604800}"
 
 rm -f output/*.csv
 rm -f output/persons/*
@@ -22,11 +24,6 @@ s-put $WARSA_ENDPOINT_URL/data http://ldf.fi/warsa/prisoners output/camps_combin
 
 curl -f --data-urlencode "query=$(cat sparql/construct_camps.sparql)" $WARSA_ENDPOINT_URL/sparql -v > output/camps.ttl
 
-echo "Pseudonymizing people and hiding personal information"
-
-python src/prune_nonpublic.py output/prisoners_plain.ttl output/prisoners_pseudonymized.ttl --endpoint "$WARSA_ENDPOINT_URL/sparql"  \
-    --logfile output/logs/person_pruning.log --loglevel $LOG_LEVEL
-
 echo "Linking ranks"
 
 python src/linker.py ranks output/prisoners_pseudonymized.ttl output/rank_links.ttl --endpoint "$WARSA_ENDPOINT_URL/sparql" \
@@ -51,7 +48,8 @@ python src/linker.py occupations output/prisoners_pseudonymized.ttl output/occup
 echo "Linking municipalities"
 
 python src/linker.py municipalities output/prisoners_pseudonymized.ttl output/municipality_links.ttl \
-    --endpoint "$WARSA_ENDPOINT_URL/sparql" --arpa $ARPA_URL/pnr_municipality --logfile output/logs/municipalities.log --loglevel $LOG_LEVEL
+    --endpoint "$WARSA_ENDPOINT_URL/sparql" --arpa $ARPA_URL/pnr_municipality --logfile output/logs/municipalities.log --loglevel $LOG_LEVEL \
+    $RESPONSE_CACHE
 
 echo "Linking Sotilaan Ääni magazines"
 
@@ -73,18 +71,15 @@ echo "Linking people"
 cat output/prisoners_pseudonymized.ttl output/rank_links.ttl output/unit_linked_validated.ttl \
     output/occupation_links.ttl output/municipality_links.ttl input_rdf/additional_links.ttl > output/prisoners_temp.ttl
 python src/linker.py persons output/prisoners_temp.ttl output/persons_linked.ttl \
-    --endpoint "$WARSA_ENDPOINT_URL/sparql" --logfile output/logs/linker.log --loglevel $LOG_LEVEL
+    --endpoint "$WARSA_ENDPOINT_URL/sparql" --logfile output/logs/linker.log --loglevel $LOG_LEVEL $RESPONSE_CACHE \
+    --person-model output/person_linkage_model.pickle
 rm output/prisoners_temp.ttl
 
 sed -r 's/^(p:.*) cidoc:P70_documents (<.*>)/\2 cidoc:P70i_is_documented_in \1/' output/persons_linked.ttl > output/persons_backlinks.ttl
 
 echo "Linking camps and hospitals"
 
-cat output/prisoners_pseudonymized.ttl output/camps.ttl > output/prisoners_temp.ttl
-s-put $WARSA_ENDPOINT_URL/data http://ldf.fi/warsa/prisoners output/prisoners_temp.ttl
-rm output/prisoners_temp.ttl
-
-python src/linker.py camps output/prisoners_pseudonymized.ttl output/camp_links.ttl --endpoint "$WARSA_ENDPOINT_URL/sparql" \
+python src/linker.py camps output/prisoners_pseudonymized.ttl output/camp_links.ttl --camps output/camps.ttl \
     --logfile output/logs/linker.log --loglevel $LOG_LEVEL
 
 echo "Linking sources"
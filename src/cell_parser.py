@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Parsers for CSV cells with sources and date ranges.
+
+Run as a script to benchmark the parsers against the former readers of RDFMapper, which compiled their regular
+expressions on each call.
+"""
+import argparse
+import datetime
+import logging
+import re
+import timeit
+from functools import partial
+
+from converters import convert_dates
+from validators import validate_dates
+
+log = logging.getLogger(__name__)
+
+SOURCE_CELL = re.compile(r'(.+) \(([^()]+)\)(.*)')
+DATE_RANGE = re.compile(r'(.+) ([0-9xX.]{5,})-([0-9xX.]{5,})')
+
+validate_range_date = partial(validate_dates, before=datetime.date(1960, 1, 1))
+
+
+def parse_value_with_source(orig_value: str):
+    """
+    Parse a value with source given in the end in parenthesis
+
+    >>> parse_value_with_source('Some text (source A)')
+    ('Some text', ['source A'], None, None, [])
+    >>> parse_value_with_source('Some text (source A) B')[4]
+    ['Ylimääräisiä merkintöjä suluissa annetun lähteen jälkeen: Some text (source A) B']
+
+    :param orig_value: string in format "value (source)"
+    :return: value, sources, date begin, date end, errors
+    """
+    if ')' in orig_value:
+        sourcematch = SOURCE_CELL.search(orig_value)
+        if sourcematch:
+            (value, sources, trash) = sourcematch.groups()
+            if trash:
+                log.warning('Found some content after sources, reverting to original: %s' % orig_value)
+                return orig_value.strip(), [sources.strip()], None, None, \
+                    ['Ylimääräisiä merkintöjä suluissa annetun lähteen jälkeen: %s' % orig_value]
+
+            return value.strip(), [sources.strip()], None, None, []
+
+    return orig_value.strip(), [], None, None, []
+
+
+def parse_semicolon_separated(orig_value: str):
+    """
+    Parse a semicolon separated value (with possible sources and date range)
+
+    >>> parse_semicolon_separated('Source: 54 13.10.1942-xx.11.1942')
+    ('54', ['Source'], datetime.date(1942, 10, 13), 'xx.11.1942', [])
+
+    :param orig_value: string in format "source: value date1-date2", or just "value"
+    :return: value, sources, date begin, date end, errors
+    """
+    errors = []
+    (sources, separator, value) = orig_value.partition(': ')
+
+    if not separator:
+        (sources, value) = ('', orig_value)
+    elif ': ' in value:
+        errors.append('Mahdollinen virhe kentän arvossa, ": " löytyy lähdeviitteen jälkeen')
+        (sources, value) = ('', orig_value)
+
+    date_begin = None
+    date_end = None
+    datematch = DATE_RANGE.search(value) if '-' in value else None
+
+    if datematch:
+        (value, date_begin, date_end) = datematch.groups()
+
+        date_begin = convert_dates(date_begin)
+        error = validate_range_date(date_begin, None)
+        if error:
+            errors.append(error)
+
+        date_end = convert_dates(date_end)
+        error = validate_range_date(date_end, None)
+        if error:
+            errors.append(error)
+
+        log.debug('Found dates for value %s: %s - %s', value, date_begin, date_end)
+
+    return value, [sources.strip()] if sources else [], date_begin, date_end, errors
+
+
+CELL_PARSERS = {
+    '/': parse_value_with_source,
+    ';': parse_semicolon_separated,
+}
+
+
+
+def _legacy_read_value_with_source(orig_value):
+    """
+    Former RDFMapper.read_value_with_source, kept as the baseline of the benchmark
+
+    :return: value, sources, erroneous content
+    """
+    sourcematch = re.search(r'(.+) \(([^()]+)\)(.*)', orig_value)
+    (value, sources, trash) = sourcematch.groups() if sourcematch else (orig_value, None, None)
+
+    if sources:
+        sources = [sources.strip()]
+
+    if trash:
+        log.warning('Found some content after sources, reverting to original: %s' % orig_value)
+        value = orig_value
+
+    return value.strip(), sources or [], trash or ''
+
+
+def _legacy_read_semicolon_separated(orig_value):
+    """
+    Former RDFMapper.read_semicolon_separated, kept as the baseline of the benchmark
+
+    :return: value, sources, date begin, date end, errors
+    """
+    date_validator = partial(validate_dates, before=datetime.date(1960, 1, 1))
+
+    errors = []
+    if ': ' in orig_value:
+        (sources, value) = orig_value.split(': ', maxsplit=1)
+    else:
+        (sources, value) = ('', orig_value)
+
+    if ': ' in value:
+        errors.append('Mahdollinen virhe kentän arvossa, ": " löytyy lähdeviitteen jälkeen')
+        (sources, value) = ('', orig_value)
+
+    datematch = re.search(r'(.+) ([0-9xX.]{5,})-([0-9xX.]{5,})', value)
+    (value, date_begin, date_end) = datematch.groups() if datematch else (value, None, None)
+
+    if date_begin:
+        date_begin = convert_dates(date_begin)
+        error = date_validator(date_begin, None)
+        if error:
+            errors.append(error)
+
+    if date_end:
+        date_end = convert_dates(date_end)
+        error = date_validator(date_end, None)
+        if error:
+            errors.append(error)
+
+    if sources:
+        sources = [sources.strip()]
+
+    if date_begin or date_end:
+        log.debug('Found dates for value %s: %s - %s' % (value, date_begin, date_end))
+
+    return value, sources or [], date_begin, date_end, errors
+
+
+def _legacy_value_with_source(orig_value):
+    """
+    Former reader of values with sources, with its result in the form of parse_value_with_source
+    """
+    value, sources, trash = _legacy_read_value_with_source(orig_value)
+    return value, sources, None, None, \
+        ['Ylimääräisiä merkintöjä suluissa annetun lähteen jälkeen: %s' % orig_value] if trash else []
+
+
+BENCHMARK_CELLS = [
+    ('value (source)', ['Karkkila', 'Karkkila (KA T-26073/18)', 'naimisissa (mikrofilmi) x',
+                        '06/07/1944 (Laine Aarne)'],
+     _legacy_value_with_source, parse_value_with_source),
+    ('source: value date-date', ['Kansan Mies', 'Sotilaan Ääni: nro 78/1943 10.9. s. 3', 'http://example.com/',
+                                 'KA T-1234: 54 13.10.1942-xx.11.1942', 'A: B: C'],
+     _legacy_read_semicolon_separated, parse_semicolon_separated),
+]
+
+
+def benchmark(number):
+    """
+    Compare the cell parsers against the former readers of RDFMapper
+
+    :param number: number of repetitions
+    :return: list of (name, former time, parser time) tuples
+    """
+    times = []
+    for name, cells, legacy, parser in BENCHMARK_CELLS:
+        legacy_time = timeit.timeit(lambda: [legacy(cell) for cell in cells], number=number)
+        parser_time = timeit.timeit(lambda: [parser(cell) for cell in cells], number=number)
+        print('{name}: {legacy:.3f}s -> {parser:.3f}s ({ratio:.1f}x) for {n} cells'.format(
+            name=name, legacy=legacy_time, parser=parser_time, ratio=legacy_time / parser_time,
+            n=number * len(cells)))
+        times.append((name, legacy_time, parser_time))
+
+    return times
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Benchmark CSV cell parsers")
+    argparser.add_argument("--number", default=20000, type=int, help="Number of repetitions")
+    args = argparser.parse_args()
+
+    logging.disable(logging.WARNING)  # Some benchmark cells have content after the sources
+    benchmark(args.number)
@@ -4,14 +4,21 @@
 Converters for CSV cell data
 """
 
-import datetime
 import logging
 import re
+from functools import lru_cache
 
+from dates import parse_date
 from namespaces import *
 
 log = logging.getLogger(__name__)
 
+NAME_CACHE_SIZE = 16384
+
+RE_NAME_SPLIT = re.compile(
+    r'([A-ZÅÄÖÜÉÓÁ/\-]+(?:\s+\(?E(?:NT)?[\.\s]+[A-ZÅÄÖÜÉÓÁ/\-]+)?\)?)\s*(?:(VON))?,?\s*([A-ZÅÄÖÜÉÓÁ/\- \(\)0-9,.]*)')
+RE_PREVIOUS_NAME = re.compile(r'([A-ZÅÄÖÜÉÓÁ/\-]{2}) +\(?(E(?:NT)?[\.\s]+)([A-ZÅÄÖÜÉÓÁ/\-]+)\)?')
+
 
 def convert_dates(raw_date: str):
     """
@@ -22,40 +29,36 @@ def convert_dates(raw_date: str):
     """
     if not raw_date:
         return raw_date
-    try:
-        date = datetime.datetime.strptime(str(raw_date).strip(), '%d/%m/%Y').date()
-    except ValueError:
-        try:
-            date = datetime.datetime.strptime(str(raw_date).strip(), '%d.%m.%Y').date()
-        except ValueError:
-            if raw_date[:2] != 'xx':
-                log.warning('Invalid value for date conversion: %s' % raw_date)
-            else:
-                log.debug('Invalid value for date conversion: %s' % raw_date)
-
-            date = raw_date
+
+    parsed = parse_date(str(raw_date))
+    date = parsed.date if parsed else None
+
+    if not date:
+        if raw_date[:2] != 'xx':
+            log.warning('Invalid value for date conversion: %s' % raw_date)
+        else:
+            log.debug('Invalid value for date conversion: %s' % raw_date)
+
+        date = raw_date
 
     return date
 
 
+@lru_cache(maxsize=NAME_CACHE_SIZE)
 def convert_person_name(raw_name: str):
     """
-    Unify name syntax and split into first names and last name
+    Unify name syntax and split into first names and last name. Results are cached, as names repeat a lot.
 
     :param raw_name: Original name string
     :return: tuple containing first names, last name and full name
     """
-    re_name_split = \
-        r'([A-ZÅÄÖÜÉÓÁ/\-]+(?:\s+\(?E(?:NT)?[\.\s]+[A-ZÅÄÖÜÉÓÁ/\-]+)?\)?)\s*(?:(VON))?,?\s*([A-ZÅÄÖÜÉÓÁ/\- \(\)0-9,.]*)'
-
     fullname = raw_name.upper()
 
-    namematch = re.search(re_name_split, fullname)
+    namematch = RE_NAME_SPLIT.search(fullname)
     (lastname, extra, firstnames) = namematch.groups() if namematch else (fullname, None, '')
 
     # Unify syntax for previous names
-    prev_name_regex = r'([A-ZÅÄÖÜÉÓÁ/\-]{2}) +\(?(E(?:NT)?[\.\s]+)([A-ZÅÄÖÜÉÓÁ/\-]+)\)?'
-    lastname = re.sub(prev_name_regex, r'\1 (ent. \3)', str(lastname))
+    lastname = RE_PREVIOUS_NAME.sub(r'\1 (ent. \3)', str(lastname))
 
     lastname = lastname.title().replace('(Ent. ', '(ent. ')
     firstnames = firstnames.title()
@@ -74,6 +77,19 @@ def convert_person_name(raw_name: str):
     return firstnames, lastname, fullname
 
 
+def convert_person_names(raw_names):
+    """
+    Unify a column of names, converting each distinct name only once
+
+    :param raw_names: iterable of original name strings, e.g. pandas Series
+    :return: list of (first names, last name, full name) tuples
+    """
+    raw_names = list(raw_names)
+    converted = {raw_name: convert_person_name(raw_name) for raw_name in set(raw_names)}
+
+    return [converted[raw_name] for raw_name in raw_names]
+
+
 def strip_dash(raw_value: str):
     return '' if raw_value.strip() == '-' else raw_value
 
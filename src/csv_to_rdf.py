@@ -6,58 +6,127 @@ Convert Prisoners of War from CSV to RDF using CIDOC CRM.
 
 import argparse
 import datetime
+import io
 import logging
+import os
 import re
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
 from functools import partial
 
+import numpy as np
 import pandas as pd
 from slugify import slugify
 
-from converters import convert_person_name, convert_dates
+from cell_parser import CELL_PARSERS
+from converters import convert_person_name, convert_person_names
 from csv2rdf import CSV2RDF
-from mapping import PRISONER_MAPPING, SOURCE_MAPPING
+from mapping import PRISONER_MAPPING, SOURCE_MAPPING, CAMP_PROPERTIES
 from namespaces import RDF, XSD, DCT, SKOS, DATA_NS, SCHEMA_POW, SCHEMA_WARSA, bind_namespaces
-from rdflib import URIRef, Graph, Literal, Namespace
+from provenance import compact_reifications, expand_dataset, triple_reifications, QUAD_FORMATS
+from rdflib import URIRef, Graph, ConjunctiveGraph, Literal, Namespace
 from rdflib.term import Identifier
+from rdflib.util import guess_format
 
-from validators import validate_person_name, validate_dates
+from row_cache import RowCache
+from sinks import TripleSink
+from spreadsheets import CROP, read_chunks, read_table
+from validators import validate_person_name, column_validator, validate_person_name_column, \
+    error_frame, ERROR_COLUMNS
 
+RESOURCE_TEMPLATE = '{entity}_{prop}_{id}'
+REIFICATION_TEMPLATE = '{entity}_{prop}_{id}_reification_{reason}'
 
-def get_triple_reifications(graph, triple):
-    found_reifications = Graph()
-    s, p, o = triple
-    reifications = list(graph.subjects(RDF.subject, s))
-    for reification in reifications:
-        if not (graph[reification:RDF.predicate:p] and graph[reification:RDF.object:o]):
-            continue
-        for (rs, rp, ro) in graph.triples((reification, None, None)):
-            found_reifications.add((rs, rp, ro))
+SEPARATOR_PATTERNS = {
+    '/': r'(?: /)|(?:/ )',
+    ';': ';',
+}
+
+ColumnHandler = namedtuple('ColumnHandler', ['column', 'position', 'split_pattern', 'split', 'read', 'converter',
+                                             'validator', 'uri', 'create_resource', 'capture_value', 'label_fi',
+                                             'label_en', 'capture_order', 'capture_dates', 'resource_template',
+                                             'reification_template'])
+
+
+def get_triple_reifications(graph, triple, index=None):
+    """
+    Get the rdf:Statement reifications of a triple.
+
+    :param index: ReificationIndex of the graph, to avoid scanning the graph when called repeatedly
+    :return: rdflib Graph
+    """
+    if index is not None:
+        return index.reifications(triple)
+
+    return triple_reifications(graph, triple)
 
-    return found_reifications
 
+def get_person_related_triples(graph, person, index=None):
+    """
+    Get the triples of a person, the triples of resources the person refers to, and their reifications.
 
-def get_person_related_triples(graph, person):
+    :param index: ReificationIndex of the graph, for getting the triples of many persons
+    :return: rdflib Graph
+    """
     found_triples = Graph()
     for (s, p, o) in graph.triples((person, None, None)):
         found_triples.add((s, p, o))
         for (s2, p2, o2) in graph.triples((o, None, None)):
             found_triples.add((s2, p2, o2))
-        found_triples += get_triple_reifications(graph, (s, p, o))
+        found_triples += get_triple_reifications(graph, (s, p, o), index)
 
     return found_triples
 
 
+def _map_shard(mapping, instance_class, shard, prisoner_numbers):
+    """
+    Map a shard of table rows to RDF in a worker process.
+
+    :return: list of triples and errors for each row
+    """
+    mapper = RDFMapper(mapping, instance_class)
+    mapper.compile_plan(shard.columns[2:])
+    results = []
+    for index, prisoner_number in zip(shard.index, prisoner_numbers):
+        row_rdf = mapper.map_row_to_rdf(DATA_NS['prisoner_' + prisoner_number], shard.loc[index][1:],
+                                        prisoner_number=prisoner_number)
+        results.append((list(row_rdf), mapper.errors))
+        mapper.errors = []
+
+    return results
+
+
+def _validate_shard(mapping, shard, prisoner_numbers):
+    """
+    Validate a shard of table rows in a worker process.
+
+    :return: list of errors
+    """
+    mapper = RDFMapper(mapping, None)
+    mapper.table = shard
+    return mapper.collect_errors(prisoner_numbers)
+
+
 class RDFMapper:
     """
     Map tabular data (currently pandas DataFrame) to RDF. Create a class instance of each row.
     """
 
-    def __init__(self, mapping, instance_class, loglevel='WARNING'):
+    def __init__(self, mapping, instance_class, loglevel='WARNING', sink=None, cache=None, provenance='reification'):
         self.mapping = mapping
         self.instance_class = instance_class
         self.table = None
-        self.data = Graph()
+        # Sources of values as rdf:Statement reifications ('reification') or as named graphs ('graphs')
+        self.provenance = provenance
+        self.data = ConjunctiveGraph() if provenance == 'graphs' else Graph()
+        self.sink = sink  # If given, data is written to the sink instead of self.data
+        self.cache = cache  # If given, RowCache of previously converted rows
         self.schema = Graph()
+        self.plan = None
+        self.plan_columns = None  # Column names self.plan is compiled for
+        self.unmapped_columns = []
+        self.used_ids = None  # Prisoner numbers of previous chunks when processing CSV chunks
         # self.errors = pd.DataFrame(columns=['nro', 'sarake', 'virhe', 'arvo'])
         self.errors = []
 
@@ -68,99 +137,89 @@ class RDFMapper:
 
         self.log = logging.getLogger(__name__)
 
-    def read_value_with_source(self, orig_value):
+    def create_resource(self, resource_uri, rdf_class, rdf_value, value_property, label_fi: str, label_en: str, capture_order,
+                        capture_dates, order, date_begin, date_end, resource_name):
         """
-        Read a value with source given in the end in parenthesis
+        Create a resource based on a CSV column
 
-        :param orig_value: string in format "value (source)"
-        :return: value, sources, erroneous content
+        :return: list of triples
         """
+        triples = [
+            (resource_uri, RDF.type, rdf_class),
+            (resource_uri, value_property, rdf_value),
+            (resource_uri, SKOS.prefLabel, Literal(label_fi.format(person=resource_name), lang='fi')),
+            (resource_uri, SKOS.prefLabel, Literal(label_en.format(person=resource_name), lang='en')),
+        ]
 
-        sourcematch = re.search(r'(.+) \(([^()]+)\)(.*)', orig_value)
-        (value, sources, trash) = sourcematch.groups() if sourcematch else (orig_value, None, None)
-
-        if sources:
-            # if ',' in sources:
-            #     print(sources)
-            # self.log.debug('Found sources: %s' % sources)
-            # sources = [s.strip() for s in sources.split(',')]
-            sources = [sources.strip()]
+        if capture_order:
+            triples.append((resource_uri, SCHEMA_POW.order, order))
 
-        if trash:
-            self.log.warning('Found some content after sources, reverting to original: %s' % orig_value)
-            value = orig_value
+        if capture_dates and (date_begin or date_end):
+            triples.append((resource_uri, SCHEMA_POW.date_begin, Literal(date_begin)))
+            triples.append((resource_uri, SCHEMA_POW.date_end, Literal(date_end)))
 
-        return value.strip(), sources or [], trash or ''
+        return triples
 
-    def read_semicolon_separated(self, orig_value: str):
+    def map_name(self, entity_uri, raw_name, prisoner_number=None, converted_name=None):
         """
-        Read semicolon separated values (with possible sources and date range)
+        Map person name to RDF.
 
-        :param orig_value: string in format "source: value date1-date2", or just "value"
-        :return: value, sources, date begin, date end, error
+        :param converted_name: result of convert_person_name for raw_name, if already converted
+        :return: triples, errors and unified full name
         """
+        (firstnames, lastname, fullname) = converted_name or convert_person_name(raw_name)
+        error = validate_person_name(' '.join((lastname, firstnames)) if firstnames else lastname, raw_name)
 
-        date_validator = partial(validate_dates, before=datetime.date(1960, 1, 1))
-
+        original_name = raw_name.strip()
+        triples = []
         errors = []
-        if ': ' in orig_value:
-            (sources, value) = orig_value.split(': ', maxsplit=1)
-        else:
-            (sources, value) = ('', orig_value)
-
-        if ': ' in value:
-            errors.append('Mahdollinen virhe kentän arvossa, ": " löytyy lähdeviitteen jälkeen')
-            (sources, value) = ('', orig_value)
-
-        datematch = re.search(r'(.+) ([0-9xX.]{5,})-([0-9xX.]{5,})', value)
-        (value, date_begin, date_end) = datematch.groups() if datematch else (value, None, None)
-
-        if date_begin:
-            date_begin = convert_dates(date_begin)
-            error = date_validator(date_begin, None)
-            if error:
-                errors.append(error)
-
-        if date_end:
-            date_end = convert_dates(date_end)
-            error = date_validator(date_end, None)
-            if error:
-                errors.append(error)
-
-        if sources:
-            # if ',' in sources:
-            #     print(sources)
-            #
-            # self.log.debug('Found sources: %s' % sources)
-            # sources = [s.strip() for s in sources.split(',')]
-            sources = [sources.strip()]
+        if error:
+            errors.append([prisoner_number, fullname, 'sukunimi ja etunimet', error, raw_name])
 
-        if date_begin or date_end:
-            self.log.debug('Found dates for value %s: %s - %s' % (value, date_begin, date_end))
+        if firstnames:
+            triples.append((entity_uri, SCHEMA_WARSA.given_names, Literal(firstnames)))
+        if lastname:
+            triples.append((entity_uri, SCHEMA_WARSA.family_name, Literal(lastname)))
+        if fullname:
+            triples.append((entity_uri, URIRef('http://www.w3.org/2004/02/skos/core#prefLabel'), Literal(fullname)))
+        if original_name:
+            triples.append((entity_uri, SCHEMA_POW.original_name, Literal(original_name)))
 
-        return value, sources or [], date_begin, date_end, errors
+        return triples, errors, fullname
 
-    def create_resource(self, resource_uri, rdf_class, rdf_value, value_property, label_fi: str, label_en: str, capture_order,
-                        capture_dates, order, date_begin, date_end, resource_name):
+    def map_value(self, entity_uri, handler, index, value, sources, date_begin, date_end, resource_name):
         """
-        Create a resource based on a CSV column
+        Map a single converted value of a column to RDF, with possible resource and source reifications.
+
+        :return: list of triples
         """
-        resource_rdf = Graph()
+        triples = []
+        if isinstance(value, Identifier):
+            rdf_value = value
+        else:
+            rdf_value = Literal(value, datatype=XSD.date) if type(value) == datetime.date else Literal(value)
 
-        resource_rdf.add((resource_uri, RDF.type, rdf_class))
-        resource_rdf.add((resource_uri, value_property, rdf_value))
+        if handler.create_resource:
+            resource_uri = DATA_NS[handler.resource_template.format(entity=entity_uri.split('/')[-1], id=index * 10)]
 
-        resource_rdf.add((resource_uri, SKOS.prefLabel, Literal(label_fi.format(person=resource_name), lang='fi')))
-        resource_rdf.add((resource_uri, SKOS.prefLabel, Literal(label_en.format(person=resource_name), lang='en')))
+            triples += self.create_resource(resource_uri, handler.create_resource, rdf_value, handler.capture_value,
+                                            handler.label_fi, handler.label_en, handler.capture_order,
+                                            handler.capture_dates, Literal(index * 10), date_begin, date_end,
+                                            resource_name)
 
-        if capture_order:
-            resource_rdf.add((resource_uri, SCHEMA_POW.order, order))
+            rdf_value = resource_uri
 
-        if capture_dates and (date_begin or date_end):
-            resource_rdf.add((resource_uri, SCHEMA_POW.date_begin, Literal(date_begin)))
-            resource_rdf.add((resource_uri, SCHEMA_POW.date_end, Literal(date_end)))
+        triples.append((entity_uri, handler.uri, rdf_value))
+
+        for source in sources:
+            reification_uri = DATA_NS[handler.reification_template.format(entity=entity_uri.split('/')[-1], id=index)]
+            triples.append((reification_uri, RDF.subject, entity_uri))
+            triples.append((reification_uri, RDF.predicate, handler.uri))
+            triples.append((reification_uri, RDF.object, rdf_value))
+            triples.append((reification_uri, RDF.type, RDF.Statement))
+            triples.append((reification_uri, DCT.source, Literal(source)))
 
-        return resource_rdf
+        return triples
 
     def map_row_to_rdf(self, entity_uri, row, prisoner_number=None):
         """
@@ -171,114 +230,48 @@ class RDFMapper:
         :param prisoner_number:
         :return:
         """
-        resource_template = '{entity}_{prop}_{id}'
-        reification_template = '{entity}_{prop}_{id}_reification_{reason}'
+        plan = self.plan_for(row.index[1:])
         row_rdf = Graph()
-        row_errors = []
-        unmapped_columns = set()
 
         # Handle first and last names
 
-        (firstnames, lastname, fullname) = convert_person_name(row[0])
-        error = validate_person_name(' '.join((lastname, firstnames)) if firstnames else lastname, row[0])
-
+        name_triples, row_errors, fullname = self.map_name(entity_uri, row[0], prisoner_number)
         original_name = row[0].strip()
-        if error:
-            row_errors.append([prisoner_number, fullname, 'sukunimi ja etunimet', error, row[0]])
-
-        if firstnames:
-            row_rdf.add((entity_uri, SCHEMA_WARSA.given_names, Literal(firstnames)))
-        if lastname:
-            row_rdf.add((entity_uri, SCHEMA_WARSA.family_name, Literal(lastname)))
-        if fullname:
-            row_rdf.add((entity_uri, URIRef('http://www.w3.org/2004/02/skos/core#prefLabel'), Literal(fullname)))
-        if original_name:
-            row_rdf.add((entity_uri, SCHEMA_POW.original_name, Literal(original_name)))
+        for triple in name_triples:
+            row_rdf.add(triple)
 
-        # Loop through the mapping dict and convert data to RDF
-        for column_name in row.index[1:]:
-
-            mapping = self.get_mapping(column_name)
-            if not mapping:
-                unmapped_columns.add(column_name)
-                continue
-
-            value = row[column_name]
-            separator = mapping.get('value_separator')
+        # Loop through the column plan and convert data to RDF
+        row_values = row.values[1:]
+        for handler in plan:
+            value = row_values[handler.position]
 
             # Make an iterable of all values in this field
-
-            # values = (val.strip() for val in re.split(r'\s/\s', str(value))) if separator == '/' else \
-            if separator == '/':
-                values = (val.strip() for val in re.split(r'(?: /)|(?:/ )', str(value)) if val)
-            elif separator == ';':
-                values = (val.strip() for val in re.split(';', str(value)) if val)
+            if handler.split:
+                values = (val.strip() for val in handler.split(str(value)) if val)
             else:
                 values = [str(value).strip()]
 
             for index, value in enumerate(values):
-
-                sources = []
-                date_begin = None
-                date_end = None
-                trash = None
-                sep_errors = []
                 original_value = value
 
-                if separator == '/':
-                    value, sources, trash = self.read_value_with_source(value)
-                elif separator == ';':
-                    value, sources, date_begin, date_end, sep_errors = self.read_semicolon_separated(value)
-
-                # temp = [s for s in sources if ',' in s]
-                # if temp:
-                #     print(temp)
+                if handler.read:
+                    value, sources, date_begin, date_end, sep_errors = handler.read(value)
+                    for sep_error in sep_errors:
+                        row_errors.append([prisoner_number, fullname, handler.column, sep_error, original_value])
+                else:
+                    sources, date_begin, date_end, sep_errors = [], None, None, []
 
-                if trash:
-                    sep_errors = ['Ylimääräisiä merkintöjä suluissa annetun lähteen jälkeen: %s' % original_value]
-                for sep_error in sep_errors:
-                    row_errors.append([prisoner_number, fullname, column_name, sep_error, original_value])
-
-                converter = mapping.get('converter')
-                validator = mapping.get('validator')
-                value = converter(value) if converter else value
-                conv_error = validator(value, original_value) if validator else None
+                if handler.converter:
+                    value = handler.converter(value)
+                conv_error = handler.validator(value, original_value) if handler.validator else None
 
                 if conv_error and not sep_errors:
-                    row_errors.append([prisoner_number, fullname, column_name, conv_error, original_value])
+                    row_errors.append([prisoner_number, fullname, handler.column, conv_error, original_value])
 
                 if value:
-                    if isinstance(value, Identifier):
-                        rdf_value = value
-                    else:
-                        rdf_value = Literal(value, datatype=XSD.date) if type(value) == datetime.date else Literal(value)
-
-                    if mapping.get('create_resource'):
-                        resource_uri = DATA_NS[resource_template.format(entity=entity_uri.split('/')[-1],
-                                                                        prop=mapping['uri'].split('/')[-1],
-                                                                        id=index * 10)]
-
-                        row_rdf += self.create_resource(resource_uri, mapping['create_resource'], rdf_value,
-                                                        mapping['capture_value'], mapping['create_resource_label_fi'],
-                                                        mapping['create_resource_label_en'],
-                                                        mapping.get('capture_order_number'),
-                                                        mapping.get('capture_dates'), Literal(index * 10),
-                                                        date_begin, date_end, original_name)
-
-                        rdf_value = resource_uri
-
-                    row_rdf.add((entity_uri, mapping['uri'], rdf_value))
-
-                    for source in sources:
-                        reification_uri = DATA_NS[reification_template.format(entity=entity_uri.split('/')[-1],
-                                                                              prop=mapping['uri'].split('/')[-1],
-                                                                              id=index,
-                                                                              reason='source')]
-                        row_rdf.add((reification_uri, RDF.subject, entity_uri))
-                        row_rdf.add((reification_uri, RDF.predicate, mapping['uri']))
-                        row_rdf.add((reification_uri, RDF.object, rdf_value))
-                        row_rdf.add((reification_uri, RDF.type, RDF.Statement))
-                        row_rdf.add((reification_uri, DCT.source, Literal(source)))
+                    for triple in self.map_value(entity_uri, handler, index, value, sources, date_begin, date_end,
+                                                 original_name):
+                        row_rdf.add(triple)
 
         if row_rdf:
             row_rdf.add((entity_uri, RDF.type, self.instance_class))
@@ -291,10 +284,67 @@ class RDFMapper:
         for error in row_errors:
             self.errors.append(error)
 
-        logging.debug('Unmapped columns: %s' % '\n'.join(sorted(unmapped_columns)))
-
         return row_rdf
 
+    def compile_plan(self, columns):
+        """
+        Compile the mapping against table header into an ordered plan of column handlers.
+
+        :param columns: data column names (without the index number and name columns)
+        :return: list of ColumnHandler
+        """
+        plan = []
+        unmapped_columns = []
+
+        for position, column_name in enumerate(columns):
+            mapping = self.get_mapping(column_name)
+            if not mapping:
+                unmapped_columns.append(column_name)
+                continue
+
+            separator = mapping.get('value_separator')
+            split_pattern = SEPARATOR_PATTERNS.get(separator)
+            prop = mapping['uri'].split('/')[-1]
+
+            plan.append(ColumnHandler(
+                column=column_name,
+                position=position,
+                split_pattern=split_pattern,
+                split=re.compile(split_pattern).split if split_pattern else None,
+                read=CELL_PARSERS.get(separator),
+                converter=mapping.get('converter'),
+                validator=mapping.get('validator'),
+                uri=mapping['uri'],
+                create_resource=mapping.get('create_resource'),
+                capture_value=mapping.get('capture_value'),
+                label_fi=mapping.get('create_resource_label_fi'),
+                label_en=mapping.get('create_resource_label_en'),
+                capture_order=mapping.get('capture_order_number'),
+                capture_dates=mapping.get('capture_dates'),
+                resource_template=RESOURCE_TEMPLATE.format(entity='{entity}', prop=prop, id='{id}'),
+                reification_template=REIFICATION_TEMPLATE.format(entity='{entity}', prop=prop, id='{id}',
+                                                                 reason='source'),
+            ))
+
+        self.plan = plan
+        self.plan_columns = tuple(columns)
+        self.unmapped_columns = unmapped_columns
+        self.log.info('Unmapped columns: %s' % ', '.join(sorted(unmapped_columns)))
+
+        return plan
+
+    def plan_for(self, columns):
+        """
+        Get the plan of column handlers for given columns, compiling it again if the columns have changed
+
+        :param columns: data column names (without the index number and name columns)
+        :return: list of ColumnHandler
+        """
+        if self.plan is None or tuple(columns) != self.plan_columns:
+            return self.compile_plan(columns)
+
+        return self.plan
+
     def get_mapping(self, column_name: str):
         """
         Get mapping for column name
@@ -305,22 +355,57 @@ class RDFMapper:
             mapping = self.mapping.get(column_name)
         return mapping
 
-    def read_csv(self, csv_input):
+    def read_csv(self, csv_input, skip_header=0, skip_footer=0, nrows=None):
         """
-        Read in a CSV files using pandas.read_csv
+        Read in a CSV file or an Excel workbook, see read_table_chunks
 
-        :param csv_input: CSV input (filename or buffer)
+        :param csv_input: CSV input (filename or buffer), or .xls or .xlsx file
         """
-        csv_data = pd.read_csv(csv_input, encoding='UTF-8', index_col=False, sep=',', quotechar='"',
-                               # parse_dates=[1], infer_datetime_format=True, dayfirst=True,
-                               na_values=[' '],
-                               converters={
-                                   'ammatti': lambda x: x.lower(),
-                                   0: lambda x: int(x) if x and x.isnumeric() else -1
-                               })
+        self.table = next(self.read_table_chunks(csv_input, None, skip_header, skip_footer, nrows))
+        logging.info('Read {num} rows from {input}'.format(num=len(self.table), input=csv_input))
 
-        self.table = csv_data.fillna('').applymap(lambda x: x.strip() if type(x) == str else x)
-        logging.info('Read {num} rows from CSV'.format(num=len(self.table)))
+    @staticmethod
+    def read_table_chunks(table_input, chunksize=None, skip_header=0, skip_footer=0, nrows=None):
+        """
+        Read a CSV file or an Excel workbook as string typed chunks. Cells are stripped and missing values are
+        replaced with ''. The first column is converted to an integer index number, or -1 if it is not a number.
+
+        :param table_input: CSV input (filename or buffer), or .xls or .xlsx file
+        :param chunksize: number of rows in a chunk, or None to read the whole table as one chunk
+        :param skip_header: number of rows to skip before the header row
+        :param skip_footer: number of rows to skip in the end
+        :param nrows: number of rows to read, or None to read all rows
+        :return: generator of pandas DataFrames
+        """
+        for chunk in read_chunks(table_input, chunksize, skip_header, skip_footer, nrows):
+            chunk = chunk.fillna('')
+            for column in chunk.columns[1:]:
+                chunk[column] = chunk[column].str.strip()
+
+            numbers = chunk.iloc[:, 0]
+            chunk[chunk.columns[0]] = numbers.where(numbers.str.isnumeric(), '-1').astype(int)
+            if 'ammatti' in chunk:
+                chunk['ammatti'] = chunk['ammatti'].str.lower()
+
+            yield chunk
+
+    def process_table_chunks(self, table_input, chunksize, process, skip_header=0, skip_footer=0, nrows=None):
+        """
+        Read and process a prisoners table in chunks, so that the whole table is never in memory.
+        Prisoner numbers are kept unique over all chunks.
+
+        :param table_input: CSV input (filename or buffer), or .xls or .xlsx file
+        :param chunksize: number of rows in a chunk
+        :param process: processing method of this mapper to run for each chunk, e.g. self.process_rows
+        """
+        self.used_ids = set()
+        for chunk in self.read_table_chunks(table_input, chunksize, skip_header, skip_footer, nrows):
+            logging.info('Read {num} rows from {input}'.format(num=len(chunk), input=table_input))
+            self.table = chunk
+            self.preprocess_prisoners_data()
+            process()
+
+        self.used_ids = None
 
     def preprocess_prisoners_data(self):
         self.table.rename(columns={'Unnamed: 0': 'nro'}, inplace=True)
@@ -334,36 +419,293 @@ class RDFMapper:
 
         logging.info('After pruning rows without proper index, {num} rows remaining'.format(num=len(self.table)))
 
+        self.plan_for(self.table.columns[2:])
+
     def serialize(self, destination_data, destination_schema):
         """
-        Serialize RDF graphs
+        Serialize RDF graphs. When streaming to a sink, only the schema is serialized. The data format is guessed from
+        the destination file name. Named graphs of sources are written as reifications to triple formats.
 
         :param destination_data: serialization destination for data
         :param destination_schema: serialization destination for schema
         :return: output from rdflib.Graph.serialize
         """
-        data = bind_namespaces(self.data).serialize(format="turtle", destination=destination_data)
+        data = None
+        if not self.sink:
+            fformat = (guess_format(str(destination_data)) if destination_data else None) or \
+                ('trig' if self.provenance == 'graphs' else 'turtle')
+            graph = self.data
+            if self.provenance == 'graphs' and fformat not in QUAD_FORMATS:
+                graph = expand_dataset(graph)  # Named graphs cannot be written in a triple format
+            data = bind_namespaces(graph).serialize(format=fformat, destination=destination_data)
+            self.log.info('Data serialized to %s' % destination_data)
         schema = bind_namespaces(self.schema).serialize(format="turtle", destination=destination_schema)
-        self.log.info('Data serialized to %s' % destination_data)
         self.log.info('Schema serialized to %s' % destination_schema)
 
         return data, schema  # Return for testing purposes
 
-    def process_rows(self):
+    def add_triples(self, triples):
         """
-        Loop through CSV rows and convert them to RDF
+        Add converted triples to the data graph, or write them to the sink if streaming output.
+        With named graph provenance, source reifications are replaced with quads in source graphs.
         """
-        used_ids = []
-        for index in self.table.index:
-            prisoner_number = str(self.table.ix[index][0])
+        if self.provenance == 'graphs':
+            triples = compact_reifications(triples)
+            if not self.sink:
+                self.data.addN((t[0], t[1], t[2], self.data.get_context(t[3]) if len(t) == 4 else
+                                self.data.default_context) for t in triples)
+                return
+
+        if self.sink:
+            self.sink.add_triples(triples)
+        else:
+            self.data.addN((s, p, o, self.data) for (s, p, o) in triples)
+
+    def prisoner_numbers(self):
+        """
+        Get unique prisoner numbers for table rows. Repeated numbers are suffixed with '_duplicate'.
+        When processing CSV chunks, numbers of the previous chunks are also taken into account.
+
+        :return: list of prisoner numbers as strings, in table order
+        """
+        used_ids = self.used_ids if self.used_ids is not None else set()
+        numbers = []
+        for number in self.table.iloc[:, 0]:
+            prisoner_number = str(number)
             while prisoner_number in used_ids:
                 prisoner_number += '_duplicate'
-            used_ids.append(prisoner_number)
-            prisoner_uri = DATA_NS['prisoner_' + prisoner_number]
-            row_rdf = self.map_row_to_rdf(prisoner_uri, self.table.ix[index][1:], prisoner_number=prisoner_number)
-            if row_rdf:
-                self.data += row_rdf
+            used_ids.add(prisoner_number)
+            numbers.append(prisoner_number)
+
+        return numbers
+
+    def map_rows(self, positions, prisoner_numbers, workers=1, pool=None):
+        """
+        Map table rows to RDF
+
+        :param positions: table row positions to map
+        :param prisoner_numbers: prisoner numbers of all table rows
+        :param workers: number of worker processes, rows are split into shards that are mapped in parallel
+        :param pool: ProcessPoolExecutor of the workers, to reuse it for many tables. Created here if not given.
+        :return: generator of triples and errors for each row, in the order of positions
+        """
+        if workers > 1 and pool is None:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                yield from self.map_rows(positions, prisoner_numbers, workers, pool)
+            return
+
+        if workers > 1:
+            shard_size = max(1, -(-len(positions) // (workers * 4)))
+            shard_positions = [positions[start:start + shard_size] for start in range(0, len(positions), shard_size)]
+            shards = [self.table.iloc[shard] for shard in shard_positions]
+            shard_numbers = [[prisoner_numbers[pos] for pos in shard] for shard in shard_positions]
+
+            # Results are returned in shard order, which keeps the output deterministic
+            for results in pool.map(partial(_map_shard, self.mapping, self.instance_class), shards, shard_numbers):
+                yield from results
+        else:
+            for pos in positions:
+                prisoner_number = prisoner_numbers[pos]
+                (errors, self.errors) = (self.errors, [])
+                row_rdf = self.map_row_to_rdf(DATA_NS['prisoner_' + prisoner_number], self.table.iloc[pos][1:],
+                                              prisoner_number=prisoner_number)
+                (errors, self.errors) = (self.errors, errors)
+                yield row_rdf, errors
+
+    def process_rows(self, workers=1, pool=None):
+        """
+        Loop through CSV rows and convert them to RDF. If a row cache is used, only new or changed rows are mapped.
+
+        :param workers: number of worker processes, rows are split into shards that are mapped in parallel
+        :param pool: ProcessPoolExecutor of the workers, to reuse it for many tables
+        """
+        prisoner_numbers = self.prisoner_numbers()
+        positions = range(len(prisoner_numbers))
+
+        keys = self.cache.row_keys(self.table, prisoner_numbers) if self.cache else [None for _ in positions]
+        cached = self.cache if self.cache else set()
+
+        mapped = self.map_rows([pos for pos in positions if keys[pos] not in cached], prisoner_numbers, workers, pool)
+
+        for key in keys:
+            if key in cached:
+                (triples, errors) = self.cache.get(key)
+            else:
+                (triples, errors) = next(mapped)
+                if self.cache:
+                    triples = list(triples)
+                    self.cache.put(key, triples, errors)
+
+            if triples:
+                self.add_triples(triples)
+            self.errors += errors
+
+        mapped.close()
+
+        self.create_schema()
+
+    def convert_column(self, column, handler):
+        """
+        Split, convert and validate a whole table column according to its column handler.
+
+        :param column: pandas Series of raw cell values
+        :param handler: ColumnHandler of the column
+        :return: DataFrame with one row per value, indexed by table row position
+        """
+        column = pd.Series(column.values).astype(str)
+
+        if handler.split_pattern:
+            pieces = column.str.split(handler.split_pattern).explode()
+            pieces = pieces[pieces.notna() & (pieces != '')].str.strip()
+        else:
+            pieces = column.str.strip()
+
+        values = pd.DataFrame({'original': pieces})
+        values['index'] = values.groupby(level=0).cumcount()
+
+        if handler.read:
+            (values['value'], values['sources'], values['date_begin'], values['date_end'], values['errors']) = \
+                zip(*pieces.map(handler.read)) if len(pieces) else ([], [], [], [], [])
+        else:
+            values['value'] = pieces
+            values['sources'] = [[]] * len(pieces)
+            values['errors'] = [[]] * len(pieces)
+            values['date_begin'] = None
+            values['date_end'] = None
+
+        if handler.converter:
+            values['value'] = values['value'].map(handler.converter).astype(object)
+        if handler.validator:
+            conv_errors = [None] * len(values)
+            error_df = column_validator(handler.validator)(values['value'].reset_index(drop=True),
+                                                           values['original'].reset_index(drop=True), handler.column)
+            for pos, error in zip(error_df.index, error_df['virhe']):
+                conv_errors[pos] = error
+            values['errors'] = [errors or ([conv_error] if conv_error else []) for errors, conv_error in
+                                zip(values['errors'], conv_errors)]
+
+        return values
+
+    def process_columns(self):
+        """
+        Convert the table to RDF one column at a time. Produces the same data and errors as process_rows.
+        """
+        plan = self.plan_for(self.table.columns[2:])
+        numbers = self.prisoner_numbers()
+        uris = [DATA_NS['prisoner_' + prisoner_number] for prisoner_number in numbers]
+        names = list(self.table.iloc[:, 1])
+        has_data = [False] * len(uris)
+        triples = []
+        errors = []  # Sortable (row position, column position, error) tuples
+
+        fullnames = []
+        for pos, (uri, prisoner_number, name, converted_name) in enumerate(zip(uris, numbers, names,
+                                                                              convert_person_names(names))):
+            name_triples, name_errors, fullname = self.map_name(uri, name, prisoner_number, converted_name)
+            triples += name_triples
+            has_data[pos] = bool(name_triples)
+            errors += [(pos, 0, error) for error in name_errors]
+            fullnames.append(fullname)
+
+        self.add_triples(triples)
+
+        for handler in plan:
+            values = self.convert_column(self.table.iloc[:, handler.position + 2], handler)
+            col_pos = handler.position + 1
+            triples = []
+
+            for pos, original, index, value, sources, date_begin, date_end, value_errors in zip(
+                    values.index, values['original'], values['index'], values['value'], values['sources'],
+                    values['date_begin'], values['date_end'], values['errors']):
+                errors += [(pos, col_pos, [numbers[pos], fullnames[pos], handler.column, error, original])
+                           for error in value_errors]
+                if value:
+                    triples += self.map_value(uris[pos], handler, index, value, sources, date_begin, date_end,
+                                              names[pos].strip())
+                    has_data[pos] = True
+
+            self.add_triples(triples)
+
+        triples = []
+        for pos, uri in enumerate(uris):
+            if has_data[pos]:
+                triples.append((uri, RDF.type, self.instance_class))
+            else:
+                logging.debug('No data found for {uri}'.format(uri=uri))
+                errors.append((pos, len(self.table.columns), [numbers[pos], fullnames[pos], '',
+                                                              'Ei tietoa henkilöstä', '']))
+
+        self.add_triples(triples)
+        self.errors += [error for (_, _, error) in sorted(errors, key=lambda e: e[:2])]
+
+        self.create_schema()
+
+    def collect_errors(self, prisoner_numbers):
+        """
+        Convert and validate the table one column at a time without mapping it to RDF.
+
+        :param prisoner_numbers: prisoner numbers of the table rows
+        :return: list of errors, same as process_columns produces
+        """
+        plan = self.plan_for(self.table.columns[2:])
+        numbers = pd.Series(prisoner_numbers, dtype=object)
+        raw_names = pd.Series(self.table.iloc[:, 1].values, dtype=object)
+        names = pd.DataFrame(convert_person_names(list(raw_names)), columns=['firstnames', 'lastname', 'fullname'],
+                             dtype=object)
+        fullnames = names['fullname']
+
+        resolved_names = (names['lastname'] + ' ' + names['firstnames']).where(names['firstnames'] != '',
+                                                                               names['lastname'])
+        error_dfs = [validate_person_name_column(resolved_names, raw_names, numbers=numbers, names=fullnames)
+                     .assign(sarake_nro=0)]
+        has_data = (names != '').any(axis=1).values | (raw_names.str.strip() != '').values
+
+        for handler in plan:
+            values = self.convert_column(self.table.iloc[:, handler.position + 2], handler)
+            has_data[values.index[values['value'].map(bool).astype(bool).values].astype(int)] = True
+
+            value_errors = values[['original', 'errors']].explode('errors')
+            error_dfs.append(error_frame(value_errors['errors'], value_errors['original'], handler.column, numbers,
+                                         fullnames).assign(sarake_nro=handler.position + 1))
+
+        no_data = pd.Series(np.where(has_data, None, 'Ei tietoa henkilöstä'), dtype=object)
+        error_dfs.append(error_frame(no_data, pd.Series('', index=no_data.index), '', numbers, fullnames)
+                         .assign(sarake_nro=len(self.table.columns)))
 
+        errors = pd.concat(error_dfs).rename_axis('rivi').reset_index()
+        errors = errors.sort_values(['rivi', 'sarake_nro'], kind='mergesort')
+
+        return errors[ERROR_COLUMNS].values.tolist()
+
+    def validate(self, workers=None, pool=None):
+        """
+        Convert and validate the table without creating RDF, to produce the same errors as a full conversion
+
+        :param workers: number of worker processes, defaults to the number of CPUs
+        :param pool: ProcessPoolExecutor of the workers, to reuse it for many tables. Created here if not given.
+        """
+        prisoner_numbers = self.prisoner_numbers()
+        workers = workers or os.cpu_count() or 1
+
+        if workers > 1 and pool is None:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                return self.validate(workers, pool)
+
+        if workers > 1:
+            shard_size = max(1, -(-len(prisoner_numbers) // (workers * 4)))
+            shard_starts = range(0, len(prisoner_numbers), shard_size)
+            shards = [self.table.iloc[start:start + shard_size] for start in shard_starts]
+            shard_numbers = [prisoner_numbers[start:start + shard_size] for start in shard_starts]
+
+            for errors in pool.map(partial(_validate_shard, self.mapping), shards, shard_numbers):
+                self.errors += errors
+        else:
+            self.errors += self.collect_errors(prisoner_numbers)
+
+    def create_schema(self):
+        """
+        Create schema for the mapped properties
+        """
         for prop in self.mapping.values():
             self.schema.add((prop['uri'], RDF.type, RDF.Property))
             if 'name_fi' in prop:
@@ -373,70 +715,206 @@ class RDFMapper:
             if 'description_fi' in prop:
                 self.schema.add((prop['uri'], DCT.description, Literal(prop['description_fi'], lang='fi')))
 
-    def write_errors(self):
+    def write_errors(self, destination='output/errors.csv'):
         """Write conversion errors to a CSV file"""
         error_df = pd.DataFrame(columns=['nro', 'nimi', 'sarake', 'virhe', 'arvo'], data=self.errors)
-        error_df.to_csv('output/errors.csv', ',', index=False)
+        error_df.to_csv(destination, ',', index=False)
+
+
+# Class, URI namespace and the columns (slugified) to mint resource URIs from, for camp and hospital tables
+LOCATION_TABLES = {
+    'CAMPS': (SCHEMA_WARSA.PowCamp, Namespace('http://ldf.fi/warsa/prisoners/camp_'),
+              ['vankeuspaikan-numero', 'vankeuspaikka']),
+    'HOSPITALS': (SCHEMA_WARSA.PowHospital, Namespace('http://ldf.fi/warsa/prisoners/hospital_'),
+                  ['sairaala', 'sijainti']),
+}
+
+
+def location_properties(columns):
+    """
+    Get RDF properties for camp or hospital table columns
+
+    :param columns: column names
+    :return: list of (slugified column name, property) tuples
+    """
+    slugs = [slugify(column) for column in columns]
+    return [(slug, CAMP_PROPERTIES.get(slug, SCHEMA_POW[slug])) for slug in slugs]
+
+
+def convert_locations(table, class_uri, namespace, id_columns):
+    """
+    Convert a camp or hospital table to RDF in one pass. Resource URIs are minted from the first non-empty
+    identifying column, and properties get their final names from CAMP_PROPERTIES.
+
+    :param table: pandas DataFrame
+    :param class_uri: class of the resources
+    :param namespace: namespace for the resource URIs
+    :param id_columns: slugified names of the columns to mint the URIs from
+    :return: generator of triples
+    """
+    properties = location_properties(table.columns)
+
+    for row in table.itertuples(index=False, name=None):
+        values = [(slug, prop, str(value).strip()) for (slug, prop), value in zip(properties, row) if pd.notna(value)]
+        values = [(slug, prop, value) for (slug, prop, value) in values if value]
+        if not values:
+            continue
+
+        identifiers = dict((slug, value) for (slug, prop, value) in reversed(values))
+        uri = namespace[slugify(next((identifiers[col] for col in id_columns if col in identifiers), 'unknown'))]
+        logging.debug(f'Minted URI for POW camp/hospital: {uri}')
+
+        yield (uri, RDF.type, class_uri)
+        for (slug, prop, value) in values:
+            yield (uri, prop, Literal(value))
+
+
+def convert_camps(tables, destination_data, destination_schema=None):
+    """
+    Convert camp and hospital tables to a single Turtle file, writing the triples as they are produced
+
+    :param tables: list of (mode, table) tuples, where mode is a key of LOCATION_TABLES
+    :param destination_data: serialization destination for data
+    :param destination_schema: serialization destination for schema
+    """
+    schema = Graph()
+
+    with TripleSink(destination_data, 'turtle') as sink:
+        for mode, table in tables:
+            (class_uri, namespace, id_columns) = LOCATION_TABLES[mode]
+            sink.add_triples(convert_locations(table, class_uri, namespace, id_columns))
 
+            for column, (slug, prop) in zip(table.columns, location_properties(table.columns)):
+                schema.add((prop, RDF.type, RDF.Property))
+                schema.add((prop, SKOS.prefLabel, Literal(column.strip(), lang='fi')))
 
-def convert_camps(class_uri, prop1, prop2, namespace):
-    mapper = CSV2RDF()
-    mapper.read_csv(args.input, sep=',')
-    mapper.convert_to_rdf(DATA_NS, SCHEMA_POW, class_uri)
+    if destination_schema:
+        bind_namespaces(schema).serialize(format="turtle", destination=destination_schema)
 
-    for old_uri in list(mapper.data.subjects(RDF.type, class_uri)):
-        new_uri = slugify(mapper.data.value(old_uri, prop1, default='')
-                          or mapper.data.value(old_uri, prop2, default='') or 'unknown')
-        new_uri = namespace[new_uri]
-        logging.debug(f'Minted new URI for POW camp/hospital: {old_uri}  -->  {new_uri}')
-        for (sub, pre, obj) in mapper.data.triples((old_uri, None, None)):
-            mapper.data.add((new_uri, pre, obj))
 
-        for (sub, pre, obj) in mapper.data.triples((old_uri, None, None)):
-            mapper.data.remove((old_uri, pre, obj))
+def convert_prisoners(mapper, table_input, columnar=False, workers=1, chunksize=None, skip_header=0, skip_footer=0,
+                      nrows=None):
+    """
+    Read and convert the prisoners table
+
+    :param mapper: RDFMapper for PRISONER_MAPPING
+    :param table_input: CSV file or Excel workbook
+    :param columnar: convert one column at a time instead of row by row
+    :param workers: number of worker processes for converting row by row
+    :param chunksize: read and process the table in chunks of given number of rows
+    :return: mapper
+    """
+    if not columnar and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return process_prisoners(mapper, table_input, partial(mapper.process_rows, workers=workers, pool=pool),
+                                     chunksize, skip_header, skip_footer, nrows)
+
+    process = mapper.process_columns if columnar else mapper.process_rows
+    return process_prisoners(mapper, table_input, process, chunksize, skip_header, skip_footer, nrows)
 
-    mapper.write_rdf(args.outdata, args.outschema, fformat='turtle')
+
+def process_prisoners(mapper, table_input, process, chunksize=None, skip_header=0, skip_footer=0, nrows=None):
+    """
+    Read the prisoners table, as a whole or in chunks, and process it
+
+    :param mapper: RDFMapper for PRISONER_MAPPING
+    :param process: function without arguments processing mapper.table
+    :return: mapper
+    """
+    if chunksize:
+        mapper.process_table_chunks(table_input, chunksize, process, skip_header, skip_footer, nrows)
+    else:
+        mapper.read_csv(table_input, skip_header, skip_footer, nrows)
+        mapper.preprocess_prisoners_data()
+        process()
+
+    return mapper
 
 
 if __name__ == "__main__":
 
-    argparser = argparse.ArgumentParser(description="Process war prisoners CSV", fromfile_prefix_chars='@')
+    argparser = argparse.ArgumentParser(description="Process war prisoners CSV or Excel files",
+                                        fromfile_prefix_chars='@')
 
     argparser.add_argument("mode", help="CSV conversion mode", default="PRISONERS",
-                           choices=["PRISONERS", "CAMPS", "HOSPITALS"])
-    argparser.add_argument("input", help="Input CSV file")
+                           choices=["PRISONERS", "VALIDATE", "CAMPS", "HOSPITALS", "CAMPS_AND_HOSPITALS", "SOURCES"])
+    argparser.add_argument("input", help="Input CSV file or Excel workbook (.xls or .xlsx)")
     argparser.add_argument("--outdata", help="Output file to serialize RDF dataset to (.ttl)", default=None)
     argparser.add_argument("--outschema", help="Output file to serialize RDF schema to (.ttl)", default=None)
     argparser.add_argument("--loglevel", default='INFO', help="Logging level, default is INFO.",
                            choices=["NOTSET", "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
+    argparser.add_argument("--columnar", action='store_true',
+                           help="Convert prisoners one column at a time instead of row by row (faster)")
+    argparser.add_argument("--workers", default=None, type=int,
+                           help="Number of worker processes for converting prisoners row by row, default is 1. "
+                                "In VALIDATE mode defaults to the number of CPUs.")
+    argparser.add_argument("--stream", choices=["nt", "turtle", "nq"],
+                           help="Write prisoner data to --outdata in given format while converting, "
+                                "instead of serializing the whole graph in the end")
+    argparser.add_argument("--provenance", choices=["reification", "graphs"], default="reification",
+                           help="Annotate value sources with rdf:Statement reifications (default), or with named "
+                                "graphs of sources, which takes about a fifth of the triples. With 'graphs' the "
+                                "output is TriG, or N-Quads if streaming.")
+    argparser.add_argument("--cache", help="Row cache file (SQLite) for converting prisoners row by row. "
+                                           "Only rows that have changed since the previous conversion are mapped.")
+    argparser.add_argument("--chunksize", default=None, type=int,
+                           help="Read and process prisoners table in chunks of given number of rows, "
+                                "instead of reading the whole table to memory")
+    argparser.add_argument("--skip-header", default=None, type=int,
+                           help="Number of rows before the header row to skip, default depends on the mode")
+    argparser.add_argument("--skip-footer", default=None, type=int,
+                           help="Number of rows in the end to skip, default depends on the mode")
+    argparser.add_argument("--hospitals", help="Hospitals Excel workbook or CSV file for CAMPS_AND_HOSPITALS mode, "
+                                               "input being the camps table")
+    argparser.add_argument("--nrows", default=None, type=int, help="Read only the given number of prisoner rows")
 
     args = argparser.parse_args()
 
+    crop_mode = {'VALIDATE': 'PRISONERS', 'CAMPS_AND_HOSPITALS': 'CAMPS'}.get(args.mode, args.mode)
+    (skip_header, skip_footer) = CROP[crop_mode]
+    skip_header = skip_header if args.skip_header is None else args.skip_header
+    skip_footer = skip_footer if args.skip_footer is None else args.skip_footer
+
     if args.mode == "PRISONERS":
+        if args.provenance == 'graphs' and args.stream not in (None, 'nq'):
+            argparser.error('Named graph provenance can only be streamed as N-Quads (--stream=nq)')
+        with ExitStack() as stack:
+            sink = stack.enter_context(TripleSink(args.outdata, args.stream)) if args.stream else None
+            cache = RowCache(args.cache, PRISONER_MAPPING, SCHEMA_WARSA.PrisonerRecord) if args.cache else None
+            if cache:
+                stack.callback(cache.close)
+            pow_mapper = RDFMapper(PRISONER_MAPPING, SCHEMA_WARSA.PrisonerRecord, loglevel=args.loglevel.upper(),
+                                   sink=sink, cache=cache, provenance=args.provenance)
+            convert_prisoners(pow_mapper, args.input, args.columnar, args.workers or 1, args.chunksize, skip_header,
+                              skip_footer, args.nrows)
+            pow_mapper.write_errors()
+
+            pow_mapper.serialize(args.outdata, args.outschema)
+
+    elif args.mode == "VALIDATE":
         pow_mapper = RDFMapper(PRISONER_MAPPING, SCHEMA_WARSA.PrisonerRecord, loglevel=args.loglevel.upper())
-        pow_mapper.read_csv(args.input)
-        pow_mapper.preprocess_prisoners_data()
+        workers = args.workers or os.cpu_count() or 1
 
-        pow_mapper.process_rows()
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                process_prisoners(pow_mapper, args.input, partial(pow_mapper.validate, workers=workers, pool=pool),
+                                  args.chunksize, skip_header, skip_footer, args.nrows)
+        else:
+            process_prisoners(pow_mapper, args.input, partial(pow_mapper.validate, workers=1), args.chunksize,
+                              skip_header, skip_footer, args.nrows)
         pow_mapper.write_errors()
 
-        pow_mapper.serialize(args.outdata, args.outschema)
-
-    elif args.mode == "CAMPS":
-        convert_camps(SCHEMA_WARSA.PowCamp,
-                      SCHEMA_POW['vankeuspaikan-numero'],
-                      SCHEMA_POW['vankeuspaikka'],
-                      Namespace('http://ldf.fi/warsa/prisoners/camp_'))
+    elif args.mode in ["CAMPS", "HOSPITALS"]:
+        convert_camps([(args.mode, read_table(args.input, skip_header, skip_footer))], args.outdata, args.outschema)
 
-    elif args.mode == "HOSPITALS":
-        convert_camps(SCHEMA_WARSA.PowHospital,
-                      SCHEMA_POW['sairaala'],
-                      SCHEMA_POW['sijainti'],
-                      Namespace('http://ldf.fi/warsa/prisoners/hospital_'))
+    elif args.mode == "CAMPS_AND_HOSPITALS":
+        convert_camps([('CAMPS', read_table(args.input, skip_header, skip_footer)),
+                       ('HOSPITALS', read_table(args.hospitals, *CROP['HOSPITALS']))],
+                      args.outdata, args.outschema)
 
     elif args.mode == "SOURCES":
         mapper = CSV2RDF(mapping=SOURCE_MAPPING)
-        mapper.read_csv(args.input, sep=',')
+        mapper.read_csv(io.StringIO(read_table(args.input, skip_header, skip_footer).to_csv(index=False)), sep=',')
         mapper.convert_to_rdf(Namespace("http://ldf.fi/warsa/prisoners/"),
                               Namespace("http://ldf.fi/schema/warsa/prisoners/"),
                               SCHEMA_WARSA.OriginalSource)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Date parsing shared by conversion, pruning and linking. Each distinct date string is parsed only once per process.
+"""
+import datetime
+import logging
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from dateutil import parser
+
+log = logging.getLogger(__name__)
+
+DATE_CACHE_SIZE = 65536
+
+FINNISH_DATE = re.compile(r'^(3[01]|[12]\d|0[1-9]|[1-9]|[xX]{1,2})([./])(1[0-2]|0[1-9]|[1-9]|[xX]{1,2})\2(\d{4}|[xX]{4})$')
+ISO_DATE = re.compile(r'^(\d{4})-(\d{2})-(\d{2})$')
+
+
+class PartialDate(namedtuple('PartialDate', ['year', 'month', 'day'])):
+    """
+    Date with possibly unknown parts, which are None
+    """
+    __slots__ = ()
+
+    @property
+    def date(self):
+        """
+        :return: datetime.date if all parts are known, otherwise None
+        """
+        return datetime.date(*self) if None not in self else None
+
+
+def _part(value: str):
+    return None if value[0] in 'xX' else int(value)
+
+
+def _parse_finnish_date(raw_date: str):
+    datematch = FINNISH_DATE.match(raw_date.strip())
+    if not datematch:
+        return None
+
+    (day, _, month, year) = datematch.groups()
+    date = PartialDate(_part(year), _part(month), _part(day))
+
+    if date.year and date.month and date.day:
+        try:
+            datetime.date(*date)
+        except ValueError:
+            return None
+
+    return date
+
+
+def _parse_iso_date(raw_date: str):
+    datematch = ISO_DATE.match(raw_date.strip())
+    if not datematch:
+        return None
+
+    try:
+        return datetime.date(*(int(part) for part in datematch.groups()))
+    except ValueError:
+        return None
+
+
+def _parse_fuzzy_date(raw_date: str, iso_date):
+    if iso_date:
+        return iso_date
+
+    date = None
+    datestr = raw_date.strip('Xx-')
+
+    try:
+        date = parser.parse(datestr).date()
+    except ValueError:
+        try:
+            date = parser.parse(datestr[-4:]).date()
+        except ValueError:
+            log.warning('Bad date: %s' % raw_date)
+
+    return date
+
+
+_UNPARSED = object()
+
+
+class ParsedDate:
+    """
+    All interpretations of a date string. The exact formats are parsed right away, the slower free form parsing only
+    when it is needed.
+    """
+    __slots__ = ('raw', 'iso', 'partial', 'value', '_fuzzy')
+
+    def __init__(self, raw_date: str):
+        self.raw = raw_date
+        self.iso = _parse_iso_date(raw_date)
+        self.partial = _parse_finnish_date(raw_date)
+        complete = self.iso or (self.partial.date if self.partial else None)
+        self.value = complete.isoformat() if complete else None
+        self._fuzzy = _UNPARSED
+
+    @property
+    def fuzzy(self):
+        if self._fuzzy is _UNPARSED:
+            self._fuzzy = _parse_fuzzy_date(self.raw, self.iso)
+        return self._fuzzy
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parsed_date(raw_date: str):
+    """
+    Parse a date string. This is the only cache of parsed dates, shared by all the parsing functions below.
+
+    :return: ParsedDate
+    """
+    return ParsedDate(raw_date)
+
+
+def parse_date(raw_date: str):
+    """
+    Parse a date in format dd.mm.yyyy or dd/mm/yyyy, where any part can be unknown.
+
+    >>> parse_date('24.12.2016')
+    PartialDate(year=2016, month=12, day=24)
+    >>> parse_date('xx.09.2016')
+    PartialDate(year=2016, month=9, day=None)
+    >>> parse_date('31.2.2016')
+    >>> parse_date('n.1918')
+
+    :param raw_date: date string
+    :return: PartialDate, or None if the string is not a valid date in these formats
+    """
+    return parsed_date(raw_date).partial
+
+
+def parse_iso_date(raw_date: str):
+    """
+    Parse an ISO 8601 date (e.g. value of an xsd:date literal)
+
+    >>> parse_iso_date('1942-02-01')
+    datetime.date(1942, 2, 1)
+
+    :return: datetime.date or None
+    """
+    return parsed_date(raw_date).iso
+
+
+def parse_fuzzy_date(raw_date: str):
+    """
+    Parse a free form date string, guessing missing parts.
+
+    >>> parse_fuzzy_date('1942-02-01')
+    datetime.date(1942, 2, 1)
+    >>> parse_fuzzy_date('noin 2002').year
+    2002
+
+    :return: datetime.date or None
+    """
+    return parsed_date(raw_date).fuzzy
+
+
+def date_value(value):
+    """
+    Get ISO 8601 string of a complete date from an RDF literal or a date string.
+
+    >>> date_value('1906-12-23')
+    '1906-12-23'
+    >>> date_value('23.12.1906')
+    '1906-12-23'
+    >>> date_value('xx.12.1906')
+
+    :return: date string or None
+    """
+    return parsed_date(str(value)).value
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Persisted dedupe model of person record linkage, retrained only when the training data changes
+"""
+import hashlib
+import inspect
+import json
+import logging
+import os
+import pickle
+import types
+from contextlib import contextmanager
+
+import dedupe
+from dedupe.api import SettingsFileLoadingException
+from warsa_linkers import person_record_linkage
+
+log = logging.getLogger(__name__)
+
+
+def _describe_function(func):
+    """
+    Describe a function by its name and source code, so that changing a comparator changes the description
+    """
+    try:
+        source = inspect.getsource(func)
+    except (OSError, TypeError):
+        source = ''
+
+    return '{module}.{name} {digest}'.format(module=func.__module__, name=getattr(func, '__qualname__', repr(func)),
+                                             digest=hashlib.sha1(source.encode('UTF-8')).hexdigest())
+
+
+def model_fingerprint(data_fields, training_links, *datasets, **params):
+    """
+    Fingerprint of everything a model is trained with. A saved model is used only for the same fingerprint.
+
+    :param data_fields: dedupe field definitions, comparator functions included by their source code
+    :param training_links: (record, person) pairs of known links
+    :param datasets: dicts of records by id, e.g. the prisoner records and the Warsa person records
+    :param params: other parameters affecting the training, e.g. sample size
+    :return: hex digest
+    """
+    def dump(value):
+        return json.dumps(value, sort_keys=True, default=str).encode('UTF-8')
+
+    digest = hashlib.sha1()
+    digest.update(dump([{key: _describe_function(value) if callable(value) else value for key, value in field.items()}
+                        for field in data_fields]))
+    digest.update(dump(sorted([str(uri) for uri in link] for link in training_links)))
+    for records in datasets:
+        digest.update(dump(len(records)))
+        for key in sorted(records, key=str):
+            digest.update(dump([str(key), records[key]]))
+    digest.update(dump(params))
+
+    return digest.hexdigest()
+
+
+def load_settings(linker, path, fingerprint):
+    """
+    Load the learned settings and blocking predicates of a saved model into a record linker
+
+    :param linker: dedupe.RecordLink
+    :param path: model file
+    :param fingerprint: fingerprint of the current training data
+    :return: True if the settings were loaded, False if the file is missing, incompatible or for other training data
+    """
+    if not os.path.exists(path):
+        return False
+
+    with open(path, 'rb') as model_file:
+        try:
+            if pickle.load(model_file) != fingerprint:
+                log.info('Training data has changed, retraining person linkage model %s' % path)
+                return False
+            trained = dedupe.StaticRecordLink(model_file, num_cores=linker.num_cores)
+        except (EOFError, pickle.UnpicklingError, SettingsFileLoadingException) as e:
+            log.warning('Unable to load person linkage model {path}, retraining it: {err}'.format(path=path, err=e))
+            return False
+
+    linker.data_model = trained.data_model
+    linker.classifier = trained.classifier
+    linker.predicates = trained.predicates
+    linker.blocker = trained.blocker
+
+    log.info('Using saved person linkage model %s' % path)
+    return True
+
+
+def save_settings(linker, path, fingerprint):
+    """
+    Save the learned settings and blocking predicates of a record linker, with the fingerprint of its training data
+    """
+    with open(path + '.tmp', 'wb') as model_file:
+        pickle.dump(fingerprint, model_file)
+        linker.writeSettings(model_file)
+    os.replace(path + '.tmp', path)
+
+    log.info('Saved person linkage model to %s' % path)
+
+
+class PersistedRecordLink(dedupe.RecordLink):
+    """
+    Record linker that uses a saved model if it was trained with the same data, and otherwise trains and saves it.
+    The fingerprint is computed when the data is sampled, as both datasets are known only then.
+    """
+    model_file = None
+    data_fields = []
+    training_links = []
+    params = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fingerprint = None
+        self.trained = False
+
+    def sample(self, data_1, data_2, *args, **kwargs):
+        self.fingerprint = model_fingerprint(self.data_fields, self.training_links, data_1, data_2,
+                                             sample_args=args, sample_kwargs=kwargs, **self.params)
+        self.trained = load_settings(self, self.model_file, self.fingerprint)
+        if not self.trained:
+            super().sample(data_1, data_2, *args, **kwargs)
+
+    def markPairs(self, labeled_pairs):
+        if not self.trained:
+            super().markPairs(labeled_pairs)
+
+    def uncertainPairs(self):
+        return [] if self.trained else super().uncertainPairs()
+
+    def train(self, *args, **kwargs):
+        if self.trained:
+            return
+        super().train(*args, **kwargs)
+        if self.fingerprint:
+            save_settings(self, self.model_file, self.fingerprint)
+
+
+@contextmanager
+def persisted_model(path, data_fields, training_links, **params):
+    """
+    Make warsa_linkers person record linkage use a PersistedRecordLink with the given model file. Only the dedupe
+    module seen by warsa_linkers.person_record_linkage is replaced, for the duration of the context.
+
+    :param path: model file
+    :param data_fields: dedupe field definitions
+    :param training_links: (record, person) pairs of known links
+    :param params: other parameters affecting the training, e.g. sample size
+    """
+    record_link = type('RecordLink', (PersistedRecordLink,), {
+        'model_file': path, 'data_fields': data_fields, 'training_links': training_links, 'params': params})
+
+    module = types.ModuleType(dedupe.__name__)
+    module.__dict__.update(vars(dedupe))
+    module.RecordLink = record_link
+
+    replaced = {name: getattr(person_record_linkage, name) for name in ['dedupe', 'RecordLink']
+                if hasattr(person_record_linkage, name)}
+    replacements = {'dedupe': module, 'RecordLink': record_link}
+    if not replaced:
+        log.warning('Person record linkage does not use dedupe.RecordLink, the model is not persisted')
+    for name in replaced:
+        setattr(person_record_linkage, name, replacements[name])
+    try:
+        yield
+    finally:
+        for (name, original) in replaced.items():
+            setattr(person_record_linkage, name, original)
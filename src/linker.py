@@ -9,10 +9,11 @@ import argparse
 import logging
 import random
 import re
+from collections import defaultdict
 from glob import glob
 
 import pandas as pd
-from arpa_linker.arpa import ArpaMimic, Arpa
+from arpa_linker.arpa import Arpa
 from rdflib import Graph, URIRef, RDF, Literal
 from rdflib.exceptions import UniquenessError
 from rdflib.namespace import SKOS, DC
@@ -21,11 +22,17 @@ from slugify import slugify
 
 import rdf_dm as r
 
+from dates import date_value
+from linkage_model import persisted_model
 from namespaces import SCHEMA_POW, BIOC, SCHEMA_WARSA, bind_namespaces, SCHEMA_ACTORS, CRM, DATA_NS, MEDIA_NS, DCT
+from provenance import read_graph
+from queries import QueryExecutor, call_query, prefetch_queries
+from response_cache import ResponseCache, cache_queries, cached_graph
+from spreadsheets import CROP, read_table
 from warsa_linkers.municipalities import link_to_pnr, link_warsa_municipality
 from warsa_linkers.occupations import link_occupations
 from warsa_linkers.person_record_linkage import link_persons, intersection_comparator, activity_comparator, \
-    get_date_value, read_person_links
+    read_person_links
 from warsa_linkers.ranks import link_ranks
 
 log = logging.getLogger(__name__)
@@ -38,21 +45,37 @@ def _preprocess(literal, prisoner, subgraph):
     return str(literal).strip()
 
 
-def link(graph, arpa, source_prop, target_graph, target_prop, preprocess=_preprocess, validator=None):
+def link(graph, arpa, source_prop, target_graph, target_prop, preprocess=_preprocess, validator=None, results=None,
+         executor=None):
     """
-    Link entities with ARPA based on parameters
+    Link entities with ARPA based on parameters. Each distinct preprocessed value is queried only once.
 
+    :param results: dict of ARPA results by query value, used as a cache and updated with new results
+    :param executor: QueryExecutor for running the queries concurrently, or None to run them one at a time
     :return: target_graph with found links
     """
     prop_str = str(source_prop).split('/')[-1]  # Used for logging
+    results = {} if results is None else results
 
-    for (prisoner, value_literal) in list(graph[:source_prop:]):
-        value = preprocess(value_literal, prisoner, graph)
+    values = [(prisoner, value_literal, preprocess(value_literal, prisoner, graph))
+              for (prisoner, value_literal) in list(graph[:source_prop:])]
 
+    distinct = list(dict.fromkeys(value for (_, _, value) in values if value))
+    queries = [value for value in distinct if value not in results]
+    log.info('Querying {num} of {distinct} distinct values of {ps} for {records} records'.format(
+        num=len(queries), distinct=len(distinct), ps=prop_str, records=len(values)))
+
+    if executor:
+        results.update(executor.map(arpa.query, queries))
+    else:
+        for value in queries:
+            results[value] = arpa.query(value)
+
+    for (prisoner, value_literal, value) in values:
         log.debug('Finding links for %s (originally %s)' % (value, value_literal))
 
         if value:
-            arpa_result = arpa.query(value)
+            arpa_result = results[value]
             if arpa_result:
                 res = arpa_result[0]['id']
 
@@ -73,8 +96,56 @@ def link(graph, arpa, source_prop, target_graph, target_prop, preprocess=_prepro
     return target_graph
 
 
-def link_camps(graph, endpoint):
-    """Link PoW camps."""
+class CampResolver:
+    """
+    Resolve camp and hospital names to camp URIs from a local graph of camps, in place of querying each name with
+    ArpaMimic. Has the same query interface as ARPA, so it can be used with the link function.
+    """
+
+    def __init__(self, camps: Graph):
+        """
+        :param camps: graph of camps and hospitals, with names as ps:camp_id and ps:captivity_location
+        """
+        self.index = defaultdict(set)  # normalized name -> camp URIs
+        for prop in [SCHEMA_POW.camp_id, SCHEMA_POW.captivity_location]:
+            for (camp, name) in camps.subject_objects(prop):
+                self.index[self.normalize(name)].add(camp)
+
+        log.info('Indexed {num} names of camps and hospitals'.format(num=len(self.index)))
+
+    @staticmethod
+    def normalize(name):
+        """
+        >>> CampResolver.normalize('  Karhumäki,  EVAKUOINTIPISTE ')
+        'karhumäki, evakuointipiste'
+        """
+        return ' '.join(str(name).split()).casefold()
+
+    def query(self, text):
+        """
+        Find camps by name. Like ARPA, also the word n-grams of the text are tried, longest first.
+
+        :param text: camp or hospital name
+        :return: list of results as dicts with 'id' key, empty if no camp is found
+        """
+        words = self.normalize(text).split(' ')
+        for n in range(len(words), 0, -1):
+            for i in range(len(words) - n + 1):
+                camps = sorted(self.index.get(' '.join(words[i:i + n]), ()))
+                if camps:
+                    if len(camps) > 1:
+                        log.warning('Ambiguous camp name {text}: {camps}'.format(text=text, camps=camps))
+                    return [{'id': str(camp)} for camp in camps]
+
+        return []
+
+
+def link_camps(graph, camps):
+    """
+    Link PoW camps.
+
+    :param camps: graph of camps and hospitals
+    """
 
     value_mapping = {
         'Siestarjoki': "Siestarjoki, ven. Sestroretsk",
@@ -83,58 +154,81 @@ def link_camps(graph, endpoint):
     }
 
     def preprocess(literal, prisoner, subgraph):
-        literal = str(literal).strip().replace('"', '\\"')
+        literal = str(literal).strip()
 
         log.debug(f'Preprocessing camp for linking, {literal} : {value_mapping.get(literal, literal)} ({prisoner})')
         return value_mapping.get(literal, literal)
 
-    query = "PREFIX ps:<http://ldf.fi/schema/warsa/prisoners/>" + \
-            "SELECT * {" + \
-            "  GRAPH <http://ldf.fi/warsa/prisoners> {" + \
-            "    VALUES ?place { \"<VALUES>\" }" + \
-            "    ?id ps:camp_id|ps:captivity_location ?place . " + \
-            "  }" + \
-            "}"
+    return link(graph, CampResolver(camps), SCHEMA_POW.location_literal, Graph(), SCHEMA_POW.location,
+                preprocess=preprocess)
+
+
+def _objects_by_subject(graph: Graph, predicate: URIRef):
+    """
+    Get the objects of a predicate for all subjects in one pass over the graph
+
+    :return: dict of lists of objects by subject
+    """
+    objects = defaultdict(list)
+    for (subject, obj) in graph.subject_objects(predicate):
+        objects[subject].append(obj)
+
+    return objects
 
-    arpa = ArpaMimic(query, url=endpoint, retries=3, wait_between_tries=3)
 
-    return link(graph, arpa, SCHEMA_POW.location_literal, Graph(), SCHEMA_POW.location, preprocess=preprocess)
+def _unique_value(values: list):
+    """
+    Get the single value of a list of objects like Graph.value with any=False
+
+    :raises UniquenessError: if there are several values
+    """
+    if len(values) > 1:
+        raise UniquenessError(values)
+
+    return values[0] if values else None
 
 
 def _generate_prisoners_dict(graph: Graph, ranks: Graph):
     """
-    Generate a persons dict from POW records.
+    Generate a persons dict from POW records. Each property is read for all prisoners at once.
     """
+    (removed_col, rank_col, given_col, family_col, birth_place_col, death_place_col, unit_col, occupation_col,
+     birth_col, death_col) = (_objects_by_subject(graph, prop) for prop in [
+        SCHEMA_POW.personal_information_removed, SCHEMA_POW.rank, SCHEMA_WARSA.given_names, SCHEMA_WARSA.family_name,
+        SCHEMA_WARSA.municipality_of_birth, SCHEMA_POW.municipality_of_death, SCHEMA_POW.unit, BIOC.has_occupation,
+        SCHEMA_WARSA.date_of_birth, SCHEMA_POW.date_of_death])
+    rank_levels_by_uri = _objects_by_subject(ranks, SCHEMA_ACTORS.level)
 
     prisoners = {}
     for person in graph[:RDF.type:SCHEMA_WARSA.PrisonerRecord]:
-        if graph.value(person, SCHEMA_POW.personal_information_removed):
+        removed = removed_col.get(person)
+        if removed and removed[0]:
             log.info('Skipping pruned person: {}'.format(str(person)))
             continue  # Personal information has been removed, do not try to link
 
-        rank_uris = list(graph.objects(person, SCHEMA_POW.rank))
+        rank_uris = rank_col.get(person, [])
 
-        given = str(graph.value(person, SCHEMA_WARSA.given_names, any=False))
-        family = str(graph.value(person, SCHEMA_WARSA.family_name, any=False))
+        given = str(_unique_value(given_col.get(person, [])))
+        family = str(_unique_value(family_col.get(person, [])))
         rank = sorted(str(r) for r in rank_uris if r) or None
-        birth_places = sorted(str(place) for place in graph.objects(person, SCHEMA_WARSA.municipality_of_birth)) or None
-        death_places = sorted(str(place) for place in graph.objects(person, SCHEMA_POW.municipality_of_death)) or None
-        units = sorted(str(unit) for unit in graph.objects(person, SCHEMA_POW.unit)) or None
-        occupations = sorted(str(occ) for occ in graph.objects(person, BIOC.has_occupation)) or None
+        birth_places = sorted(str(place) for place in birth_place_col.get(person, [])) or None
+        death_places = sorted(str(place) for place in death_place_col.get(person, [])) or None
+        units = sorted(str(unit) for unit in unit_col.get(person, [])) or None
+        occupations = sorted(str(occ) for occ in occupation_col.get(person, [])) or None
 
-        births = [get_date_value(bd) for bd in graph.objects(person, SCHEMA_WARSA.date_of_birth)]
-        deaths = [get_date_value(dd) for dd in graph.objects(person, SCHEMA_POW.date_of_death)]
+        births = [date_value(bd) for bd in birth_col.get(person, [])]
+        deaths = [date_value(dd) for dd in death_col.get(person, [])]
         birth_begin = min([d for d in births if d] or [None])
         birth_end = max([d for d in births if d] or [None])
         death_begin = min([d for d in deaths if d] or [None])
         death_end = max([d for d in deaths if d] or [None])
 
         rank_levels = []
-        try:
-            for rank_uri in rank_uris:
-                rank_levels.append(int(ranks.value(rank_uri, SCHEMA_ACTORS.level, any=False)))
-        except (TypeError, UniquenessError):
-            pass
+        for rank_uri in rank_uris:
+            levels = rank_levels_by_uri.get(rank_uri, [])
+            if len(levels) != 1:
+                break  # Rank level is missing or ambiguous
+            rank_levels.append(int(levels[0]))
 
         prisoner = {'person': None,
                     'rank': rank,
@@ -171,7 +265,14 @@ def _prune_person_links(graph, links):
     return pruned_links
 
 
-def link_prisoners(input_graph, endpoint):
+def link_prisoners(input_graph, endpoint, cache=None, model_file=None, executor=None):
+    """
+    Link prisoner records to persons with dedupe, trained with known links
+
+    :param cache: ResponseCache for the ranks query
+    :param executor: QueryExecutor for the timeout and retries of the ranks query
+    :param model_file: file for the trained model, reused while the training data stays the same
+    """
     data_fields = [
         {'field': 'given', 'type': 'String'},
         {'field': 'family', 'type': 'String'},
@@ -188,7 +289,8 @@ def link_prisoners(input_graph, endpoint):
         {'field': 'occupation', 'type': 'Custom', 'comparator': intersection_comparator, 'has missing': True},
     ]
 
-    ranks = r.read_graph_from_sparql(endpoint, "http://ldf.fi/warsa/ranks")
+    ranks = cached_graph(cache, endpoint, "http://ldf.fi/warsa/ranks",
+                         lambda: call_query(executor, r.read_graph_from_sparql, endpoint, "http://ldf.fi/warsa/ranks"))
 
     random.seed(42)  # Initialize randomization to create deterministic results
     numpy.random.seed(42)
@@ -203,11 +305,15 @@ def link_prisoners(input_graph, endpoint):
 
     log.info('Using %s person links as training data' % len(training_links))
 
-    return link_persons(endpoint, _generate_prisoners_dict(input_graph, ranks), data_fields, training_links,
-                        sample_size=100000,
-                        training_size=500000,  # 500000 provides good results but takes ages
-                        threshold_ratio=0.8
-                        )
+    training = dict(sample_size=100000,
+                    training_size=500000)  # 500000 provides good results but takes ages
+    prisoners = _generate_prisoners_dict(input_graph, ranks)
+
+    if not model_file:
+        return link_persons(endpoint, prisoners, data_fields, training_links, threshold_ratio=0.8, **training)
+
+    with persisted_model(model_file, data_fields, training_links, **training):
+        return link_persons(endpoint, prisoners, data_fields, training_links, threshold_ratio=0.8, **training)
 
 
 def add_link(graph: Graph, munic_mapping: dict, sourceprop: URIRef, targetprop: URIRef):
@@ -222,17 +328,28 @@ def add_link(graph: Graph, munic_mapping: dict, sourceprop: URIRef, targetprop:
     return munic_links
 
 
-def link_municipalities(g: Graph, warsa_endpoint: str, arpa_endpoint: str):
+def link_municipalities(g: Graph, warsa_endpoint: str, arpa_endpoint: str, executor: QueryExecutor = None,
+                        cache: ResponseCache = None):
     """
     Link to Warsa municipalities.
+
+    :param executor: QueryExecutor for running the PNR ARPA queries concurrently, and for the timeout and retries of
+                     the municipality graph query
+    :param cache: ResponseCache for the municipality graph and the PNR ARPA queries
     """
 
-    warsa_munics = r.helpers.read_graph_from_sparql(warsa_endpoint,
-                                                    graph_name='http://ldf.fi/warsa/places/municipalities')
+    warsa_munics = cached_graph(cache, warsa_endpoint, 'http://ldf.fi/warsa/places/municipalities',
+                                lambda: call_query(executor, r.helpers.read_graph_from_sparql, warsa_endpoint,
+                                                   graph_name='http://ldf.fi/warsa/places/municipalities'))
 
     log.info('Using Warsa municipalities with {n} triples'.format(n=len(warsa_munics)))
 
-    pnr_arpa = Arpa(arpa_endpoint)
+    pnr_arpa = Arpa(arpa_endpoint, retries=0) if executor else Arpa(arpa_endpoint)  # Executor retries the queries
+    if cache:
+        cache_queries(pnr_arpa, cache, arpa_endpoint)
+    if executor:
+        prefetch_queries(pnr_arpa, [str(value) for value in g.objects(None, SCHEMA_POW.municipality_of_death_literal)],
+                         executor)
     pnr_links = link_to_pnr(g,
                             SCHEMA_POW.municipality_of_death,
                             SCHEMA_POW.municipality_of_death_literal,
@@ -450,12 +567,15 @@ def link_videos(g: Graph, input_file: str):
     return links, documents
 
 
-def link_sources(g: Graph, input_file: str):
+def link_sources(g: Graph, input_file: str, skip_header=0):
     """
     Links sources in place.
+
+    :param input_file: sources spreadsheet (Excel workbook or CSV file)
+    :param skip_header: number of rows before the header row to skip
     """
 
-    source_index = pd.read_csv(input_file, encoding='UTF-8', index_col=False, sep=',', quotechar='"', dtype=str)
+    source_index = read_table(input_file, skip_header=skip_header)
     sources = {}
 
     # Create sources from sources spreadsheet
@@ -515,14 +635,34 @@ if __name__ == '__main__':
     argparser.add_argument("task", help="Linking task to perform",
                            choices=["camps", "occupations", "municipalities", "persons", "ranks", "sotilaan_aani",
                                     "person_documents", "videos", "sources"])
-    argparser.add_argument("input", help="Input RDF file")
+    argparser.add_argument("input", help="Input RDF file, source annotations as reifications or named graphs")
     argparser.add_argument("output", help="Output file location")
     argparser.add_argument("--logfile", default='tasks.log', help="Logfile")
     argparser.add_argument("--loglevel", default='INFO', help="Logging level, default is INFO.",
                            choices=["NOTSET", "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
     argparser.add_argument("--endpoint", default='http://localhost:3030/warsa/sparql', help="SPARQL Endpoint")
     argparser.add_argument("--arpa", type=str, help="ARPA instance URL for linking")
+    argparser.add_argument("--camps", default='output/camps.ttl', help="Camps and hospitals RDF file for linking camps")
+    argparser.add_argument("--person-model", help="Person linkage model file, trained again only if the training links "
+                                                  "or data fields have changed")
     argparser.add_argument("--output2", type=str, help="Additional output file (media document metadata)")
+    argparser.add_argument("--connections", default=4, type=int,
+                           help="Maximum number of concurrent ARPA queries, default is 4")
+    argparser.add_argument("--timeout", default=60, type=float,
+                           help="Timeout of a single ARPA or SPARQL query in seconds, default is 60. Not applied to "
+                                "the ranks and occupations tasks, and the person queries of the persons task, which "
+                                "are made by warsa_linkers.")
+    argparser.add_argument("--retries", default=3, type=int,
+                           help="Number of retries of failed queries, with exponential backoff, default is 3")
+    argparser.add_argument("--response-cache", help="Response cache file (SQLite) for ARPA and SPARQL queries")
+    argparser.add_argument("--cache-ttl", default=None, type=float,
+                           help="Time to live of cached responses in seconds, default is no expiry")
+    argparser.add_argument("--replay", action='store_true',
+                           help="Only use cached responses, failing on queries that are not in the response cache. "
+                                "Not supported by the ranks and occupations tasks, whose queries are made by "
+                                "warsa_linkers without the response cache.")
+    argparser.add_argument("--invalidate-cache", action='store_true',
+                           help="Remove all cached responses before linking")
 
     args = argparser.parse_args()
 
@@ -532,16 +672,19 @@ if __name__ == '__main__':
     log.addHandler(log_handler)
     log.setLevel(args.loglevel)
 
-    input_graph = Graph()
-    input_graph.parse(args.input, format=guess_format(args.input))
+    input_graph = read_graph(args.input, expand=False)  # Sources are not used in linking
+    executor = QueryExecutor(args.connections, args.timeout, args.retries)
+    cache = ResponseCache(args.response_cache, args.cache_ttl, args.replay) if args.response_cache else None
+    if cache and args.invalidate_cache:
+        cache.invalidate()
 
     if args.task == 'camps':
         log.info('Linking camps and hospitals')
-        bind_namespaces(link_camps(input_graph, args.endpoint)).serialize(args.output, format=guess_format(args.output))
+        bind_namespaces(link_camps(input_graph, read_graph(args.camps))).serialize(args.output, format=guess_format(args.output))
 
     elif args.task == 'municipalities':
         log.info('Linking municipalities')
-        bind_namespaces(link_municipalities(input_graph, args.endpoint, args.arpa)).serialize(args.output, format=guess_format(args.output))
+        bind_namespaces(link_municipalities(input_graph, args.endpoint, args.arpa, executor, cache)).serialize(args.output, format=guess_format(args.output))
 
     elif args.task == 'occupations':
         log.info('Linking occupations')
@@ -550,7 +693,7 @@ if __name__ == '__main__':
 
     elif args.task == 'persons':
         log.info('Linking persons')
-        bind_namespaces(link_prisoners(input_graph, args.endpoint)).serialize(args.output, format=guess_format(args.output))
+        bind_namespaces(link_prisoners(input_graph, args.endpoint, cache, args.person_model, executor)).serialize(args.output, format=guess_format(args.output))
 
     elif args.task == 'ranks':
         log.info('Linking ranks')
@@ -577,5 +720,8 @@ if __name__ == '__main__':
 
     elif args.task == 'sources':
         log.info('Linking sources')
-        sources = link_sources(input_graph, 'output/sources_cropped.csv')
+        sources = link_sources(input_graph, 'data/sources.xlsx', skip_header=CROP['SOURCES'][0])
         bind_namespaces(sources).serialize(args.output, format=guess_format(args.output))
+
+    if cache:
+        cache.close()
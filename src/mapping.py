@@ -463,3 +463,18 @@ SOURCE_MAPPING = {
             'uri': DCT.description,
         },
 }
+
+# Property names of camp and hospital columns that differ from the slugified column name
+CAMP_PROPERTIES = {
+    'sijainti': SCHEMA_POW.location,
+    'vankeuspaikan-numero': SCHEMA_POW.camp_id,
+    'vankeuspaikka': SCHEMA_POW.captivity_location,
+    'toiminta-aika': SCHEMA_POW.time_of_operation,
+    'tietoa-vankeuspaikasta': SCHEMA_POW.camp_information,
+    'valokuvat': SCHEMA_POW.camp_photographs,
+    'koordinaatit-kartalla': SCHEMA_POW.coordinates,
+    'sairaala': SCHEMA_POW.camp_id,
+    'sairaalan-tyyppi': SCHEMA_POW.hospital_type,
+    'tietoa-sairaalasta': SCHEMA_POW.camp_information,
+    'kuvat': SCHEMA_POW.camp_photographs,
+}
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Convert prisoners table to RDF and hide non-public information in one process, without serializing and parsing
+the plain data in between.
+"""
+import argparse
+import logging
+
+from csv_to_rdf import RDFMapper, convert_prisoners
+from mapping import PRISONER_MAPPING
+from namespaces import SCHEMA_WARSA, bind_namespaces
+from provenance import write_graph
+from prune_nonpublic import prune_persons, load_policy, PRIVACY_POLICY
+from response_cache import ResponseCache
+from row_cache import RowCache
+from spreadsheets import CROP
+
+log = logging.getLogger(__name__)
+
+
+def convert_and_prune(table_input, destination_pruned, destination_schema, destination_plain=None, endpoint=None,
+                      names_snapshot=None, refresh_names=False, policy=PRIVACY_POLICY, loglevel='INFO',
+                      destination_errors='output/errors.csv', response_cache=None, **conversion):
+    """
+    Convert prisoners table and prune the resulting graph in memory
+
+    :param table_input: prisoners CSV file or Excel workbook
+    :param destination_pruned: file for the pseudonymized data
+    :param destination_schema: file for the schema
+    :param destination_plain: file for the plain data before pruning, or None to not write it
+    :param endpoint: SPARQL endpoint for family name counts
+    :param names_snapshot: local snapshot file of family name counts of the endpoint
+    :param refresh_names: update the snapshot from the endpoint
+    :param policy: privacy policy, see prune_nonpublic.PRIVACY_POLICY
+    :param destination_errors: file for the conversion errors (CSV)
+    :param response_cache: ResponseCache for the family name query
+    :param conversion: keyword arguments for csv_to_rdf.convert_prisoners, and cache (RowCache)
+    :return: pruned graph
+    """
+    mapper = RDFMapper(PRISONER_MAPPING, SCHEMA_WARSA.PrisonerRecord, loglevel=loglevel,
+                       cache=conversion.pop('cache', None))
+    convert_prisoners(mapper, table_input, **conversion)
+    mapper.write_errors(destination_errors)
+
+    bind_namespaces(mapper.schema).serialize(format='turtle', destination=destination_schema)
+
+    if destination_plain:
+        write_graph(bind_namespaces(mapper.data), destination_plain)
+        log.info('Plain data serialized to %s' % destination_plain)
+
+    graph = prune_persons(mapper.data, endpoint, names_snapshot, refresh_names, policy, response_cache)
+    write_graph(bind_namespaces(graph), destination_pruned)
+    log.info('Pseudonymized data serialized to %s' % destination_pruned)
+
+    return graph
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description=__doc__, fromfile_prefix_chars='@')
+    argparser.add_argument("input", help="Input CSV file or Excel workbook (.xls or .xlsx)")
+    argparser.add_argument("output", help="Output RDF file for pseudonymized data, "
+                                          "source annotations as named graphs for .nq and .trig")
+    argparser.add_argument("--outschema", help="Output file to serialize RDF schema to (.ttl)", required=True)
+    argparser.add_argument("--outplain", default=None, help="Output RDF file for plain data before pruning")
+    argparser.add_argument("--endpoint", default='http://localhost:3030/warsa/sparql', help="SPARQL Endpoint")
+    argparser.add_argument("--names-snapshot", default=None,
+                           help="Local snapshot (JSON) of family name counts of the endpoint. "
+                                "Created from the endpoint if missing, and used instead of the endpoint if present.")
+    argparser.add_argument("--refresh-names", action='store_true',
+                           help="Update the family name snapshot and its cached response from the endpoint")
+    argparser.add_argument("--policy", default=None,
+                           help="Privacy policy JSON file overriding parts of the default policy")
+    argparser.add_argument("--response-cache", help="Response cache file (SQLite) for SPARQL queries")
+    argparser.add_argument("--cache-ttl", default=None, type=float,
+                           help="Time to live of cached responses in seconds, default is no expiry")
+    argparser.add_argument("--replay", action='store_true',
+                           help="Only use cached responses, failing on queries that are not in the response cache")
+    argparser.add_argument("--invalidate-cache", action='store_true',
+                           help="Remove all cached responses before querying")
+    argparser.add_argument("--columnar", action='store_true',
+                           help="Convert prisoners one column at a time instead of row by row (faster)")
+    argparser.add_argument("--workers", default=1, type=int,
+                           help="Number of worker processes for converting prisoners row by row, default is 1")
+    argparser.add_argument("--cache", help="Row cache file (SQLite) for converting prisoners row by row")
+    argparser.add_argument("--chunksize", default=None, type=int,
+                           help="Read and process prisoners table in chunks of given number of rows")
+    argparser.add_argument("--nrows", default=None, type=int, help="Read only the given number of prisoner rows")
+    argparser.add_argument("--loglevel", default='INFO', help="Logging level, default is INFO.",
+                           choices=["NOTSET", "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
+    args = argparser.parse_args()
+
+    cache = RowCache(args.cache, PRISONER_MAPPING, SCHEMA_WARSA.PrisonerRecord) if args.cache else None
+    response_cache = ResponseCache(args.response_cache, args.cache_ttl, args.replay) if args.response_cache else None
+    if response_cache and args.invalidate_cache:
+        response_cache.invalidate()
+    (skip_header, skip_footer) = CROP['PRISONERS']
+
+    convert_and_prune(args.input, args.output, args.outschema, args.outplain, args.endpoint, args.names_snapshot,
+                      args.refresh_names, load_policy(args.policy) if args.policy else PRIVACY_POLICY,
+                      loglevel=args.loglevel.upper(), response_cache=response_cache, cache=cache,
+                      columnar=args.columnar, workers=args.workers, chunksize=args.chunksize,
+                      skip_header=skip_header, skip_footer=skip_footer, nrows=args.nrows)
+
+    if cache:
+        cache.close()
+    if response_cache:
+        response_cache.close()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Source annotations of triples in two forms:
+
+- reification: each annotated triple has an rdf:Statement node with rdf:subject, rdf:predicate, rdf:object and
+  dct:source literals (5 triples for a triple with one source)
+- graphs: each annotated triple is also in a named graph for each of its sources (1 quad for each source)
+
+The graph names encode the source literal, so the two forms can be converted to each other.
+"""
+import hashlib
+import logging
+from collections import defaultdict
+from urllib.parse import quote, unquote
+
+from rdflib import ConjunctiveGraph, Graph, Literal, Namespace, URIRef
+from rdflib.util import guess_format
+
+from namespaces import DATA_NS, DCT, RDF
+
+log = logging.getLogger(__name__)
+
+SOURCE_GRAPHS = Namespace('http://ldf.fi/warsa/prisoners/source_graph/')
+
+QUAD_FORMATS = ['nquads', 'trig']
+
+
+def source_graph(source):
+    """
+    Get named graph URI for a source
+
+    >>> source_graph('KA T-26073/18')
+    rdflib.term.URIRef('http://ldf.fi/warsa/prisoners/source_graph/KA%20T-26073%2F18')
+    """
+    return SOURCE_GRAPHS[quote(str(source), safe='')]
+
+
+def graph_source(graph_uri):
+    """
+    Get source literal of a named graph URI, or None if it is not a source graph
+
+    >>> graph_source(source_graph('KA T-26073/18'))
+    rdflib.term.Literal('KA T-26073/18')
+    """
+    if not str(graph_uri).startswith(str(SOURCE_GRAPHS)):
+        return None
+
+    return Literal(unquote(str(graph_uri)[len(SOURCE_GRAPHS):]))
+
+
+def compact_reifications(triples):
+    """
+    Replace the source reifications in a batch of triples with quads in source graphs. A statement node is replaced
+    only if all of its triples are in the batch.
+
+    :param triples: iterable of triples, e.g. triples of a single person record
+    :return: list of triples and quads
+    """
+    triples = list(triples)
+    statements = {s for (s, p, o) in triples if p == RDF.type and o == RDF.Statement}
+    if not statements:
+        return triples
+
+    parts = defaultdict(lambda: defaultdict(set))
+    for (s, p, o) in triples:
+        if s in statements:
+            parts[s][p].add(o)
+
+    compacted = set()
+    result = [(s, p, o) for (s, p, o) in triples if s not in statements]
+    for statement, properties in parts.items():
+        if set(properties) != {RDF.type, RDF.subject, RDF.predicate, RDF.object, DCT.source} or \
+                any(len(properties[prop]) != 1 for prop in [RDF.subject, RDF.predicate, RDF.object]):
+            continue
+
+        ((s,), (p,), (o,)) = (properties[RDF.subject], properties[RDF.predicate], properties[RDF.object])
+        result += [(s, p, o, source_graph(source)) for source in sorted(properties[DCT.source])]
+        compacted.add(statement)
+
+    result += [(s, p, o) for (s, p, o) in triples if s in statements and s not in compacted]
+
+    return result
+
+
+def statement_uri(triple):
+    """
+    Mint a statement node URI for a triple
+    """
+    digest = hashlib.sha1(' '.join(term.n3() for term in triple).encode('UTF-8')).hexdigest()
+    return DATA_NS['statement_' + digest[:20]]
+
+
+def expand_quads(quads):
+    """
+    Replace quads in source graphs with triples and their source reifications
+
+    :param quads: iterable of (s, p, o, graph identifier) quads, graph identifier being None for the default graph
+    :return: generator of triples
+    """
+    for (s, p, o, g) in quads:
+        source = graph_source(g) if g is not None else None
+        if source is None:
+            yield (s, p, o)
+            continue
+
+        statement = statement_uri((s, p, o))
+        yield (s, p, o)
+        yield (statement, RDF.subject, s)
+        yield (statement, RDF.predicate, p)
+        yield (statement, RDF.object, o)
+        yield (statement, RDF.type, RDF.Statement)
+        yield (statement, DCT.source, source)
+
+
+def expand_dataset(dataset):
+    """
+    Convert a dataset with source graphs to a graph with source reifications
+
+    :param dataset: rdflib ConjunctiveGraph
+    :return: rdflib Graph
+    """
+    graph = Graph()
+    graph.namespace_manager = dataset.namespace_manager
+    for triple in expand_quads((s, p, o, ctx.identifier if isinstance(ctx.identifier, URIRef) else None)
+                               for (s, p, o, ctx) in dataset.quads((None, None, None, None))):
+        graph.add(triple)
+
+    return graph
+
+
+def read_graph(source, fformat=None, expand=True):
+    """
+    Read RDF with source annotations in either form.
+
+    By default named graphs of sources are expanded to reifications when reading, so the whole graph is held in memory
+    in the reified form. The statement nodes of expanded reifications are named by a hash of the triple (see
+    statement_uri), not like the reifications made by the conversion. Without expanding, quads are returned as a
+    ConjunctiveGraph, whose triples are the union of its graphs and whose sources are found with triple_sources.
+
+    :param source: file name
+    :param fformat: RDF format, guessed from the file name by default
+    :param expand: expand named graphs of sources to reifications
+    :return: rdflib Graph, or ConjunctiveGraph for quad formats if not expanded
+    """
+    fformat = fformat or guess_format(str(source)) or 'turtle'
+
+    if fformat not in QUAD_FORMATS:
+        return Graph().parse(source, format=fformat)
+
+    dataset = ConjunctiveGraph()
+    dataset.parse(source, format=fformat)
+    if not expand:
+        log.info('Read {num} triples from {source}'.format(num=len(dataset), source=source))
+        return dataset
+
+    graph = expand_dataset(dataset)
+
+    log.info('Read {num} triples from {source}'.format(num=len(graph), source=source))
+    return graph
+
+
+def write_graph(graph, destination, fformat=None):
+    """
+    Serialize a graph with source reifications. For quad formats (N-Quads, TriG) the reifications are written as
+    named graphs of sources.
+
+    :param graph: rdflib Graph, or ConjunctiveGraph with source graphs, which are written as reifications to triple
+                  formats
+    :param destination: file name
+    :param fformat: RDF format, guessed from the file name by default
+    """
+    fformat = fformat or guess_format(str(destination)) or 'turtle'
+
+    if isinstance(graph, ConjunctiveGraph):
+        if fformat not in QUAD_FORMATS:
+            graph = expand_dataset(graph)
+    elif fformat in QUAD_FORMATS:
+        dataset = ConjunctiveGraph()
+        dataset.namespace_manager = graph.namespace_manager
+        dataset.addN((t[0], t[1], t[2], dataset.get_context(t[3]) if len(t) == 4 else dataset.default_context)
+                     for t in compact_reifications(graph))
+        graph = dataset
+
+    graph.serialize(destination=destination, format=fformat)
+
+
+def default_graph(graph):
+    """
+    Get the graph to add unannotated triples to: the default graph of a ConjunctiveGraph, or the graph itself
+    """
+    return graph.default_context if isinstance(graph, ConjunctiveGraph) else graph
+
+
+def triple_sources(graph, triple):
+    """
+    Get the sources of a triple, from both source graphs (of a ConjunctiveGraph) and reifications
+
+    :param graph: rdflib Graph or ConjunctiveGraph
+    :param triple: (s, p, o) triple
+    :return: set of source literals
+    """
+    sources = set()
+    if isinstance(graph, ConjunctiveGraph):
+        sources.update(graph_source(context.identifier) for context in graph.contexts(triple))
+        sources.discard(None)
+
+    for (statement, _, _) in triple_reifications(graph, triple).triples((None, RDF.type, RDF.Statement)):
+        sources.update(graph.objects(statement, DCT.source))
+
+    return sources
+
+
+def triple_reifications(graph, triple):
+    """
+    Get the rdf:Statement reifications of a triple by looking up the statements of its subject. For many triples of
+    the same graph, ReificationIndex is faster.
+
+    :return: rdflib Graph
+    """
+    found_reifications = Graph()
+    s, p, o = triple
+    for reification in list(graph.subjects(RDF.subject, s)):
+        if not (graph[reification:RDF.predicate:p] and graph[reification:RDF.object:o]):
+            continue
+        for reification_triple in graph.triples((reification, None, None)):
+            found_reifications.add(reification_triple)
+
+    return found_reifications
+
+
+class ReificationIndex:
+    """
+    Index of the rdf:Statement reifications of a graph by the reified triple. The index is built once, and kept up to
+    date when triples are removed through it.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.statements = defaultdict(set)  # (s, p, o) -> statement nodes
+        self.reified = defaultdict(set)  # statement node -> (s, p, o) triples
+
+        for (statement, _, s) in graph.triples((None, RDF.subject, None)):
+            for p in graph.objects(statement, RDF.predicate):
+                for o in graph.objects(statement, RDF.object):
+                    self.statements[(s, p, o)].add(statement)
+                    self.reified[statement].add((s, p, o))
+
+        log.debug('Indexed {num} reifications'.format(num=len(self.reified)))
+
+    def reifications(self, triple):
+        """
+        Get the reification triples of a triple
+
+        :param triple: reified (s, p, o) triple
+        :return: rdflib Graph
+        """
+        found = Graph()
+        for statement in self.statements.get(triple, ()):
+            for reification_triple in self.graph.triples((statement, None, None)):
+                found.add(reification_triple)
+
+        return found
+
+    def remove(self, triple):
+        """
+        Remove a triple and its reifications from the graph
+        """
+        self.remove_triples([triple])
+
+    def remove_triples(self, triples):
+        """
+        Remove triples and their reifications from the graph in one batch
+        """
+        triples = set(triples)
+        statements = set()
+        for triple in triples:
+            statements.update(self.statements.pop(triple, ()))
+
+        for statement in statements:
+            triples.update(self.graph.triples((statement, None, None)))
+            for other in self.reified.pop(statement, ()):
+                if other in self.statements:
+                    self.statements[other].discard(statement)
+
+        for triple in triples:
+            self.graph.remove(triple)
@@ -4,21 +4,26 @@
 Hide parts of personal information.
 """
 import argparse
+import json
 import logging
+import os
+from collections import Counter
 
+import numpy as np
+import pandas as pd
 import requests
-from datetime import date
+from datetime import date, datetime
 from pprint import pprint
 
-from dateutil import parser
 from dateutil.relativedelta import relativedelta
-from rdflib.util import guess_format
 
+from dates import parse_fuzzy_date
 from namespaces import bind_namespaces, SCHEMA_WARSA, SCHEMA_POW, SKOS
+from provenance import default_graph, read_graph, write_graph, triple_reifications, ReificationIndex
+from response_cache import ResponseCache
 from rdflib import Graph, RDF, URIRef, Literal
 from rdflib.compare import graph_diff, isomorphic
 
-from csv_to_rdf import get_person_related_triples, get_triple_reifications
 
 log = logging.getLogger(__name__)
 
@@ -48,107 +53,246 @@ def cast_date(orig_date: str):
     >>> cast_date('3.2.1942 (VM); 2.11.1942').year
     1942
     """
-    datestr = orig_date.strip('Xx-')
-    cast = None
+    return parse_fuzzy_date(str(orig_date))
+
+
+# Properties of a person record that are hidden with health information
+HEALTH_PROPERTIES = [
+    SCHEMA_POW.cause_of_death,
+    SCHEMA_POW.additional_information,
+]
+
+# Properties of a person record that are hidden with personal information, in addition to uncommon family names
+PERSONAL_PROPERTIES = [
+    SCHEMA_WARSA.given_names,
+    SCHEMA_POW.original_name,
+    SKOS.prefLabel,
+    SCHEMA_WARSA.date_of_birth,
+    SCHEMA_WARSA.municipality_of_birth_literal,
+    SCHEMA_POW.municipality_of_domicile_literal,
+    SCHEMA_POW.municipality_of_residence_literal,
+    SCHEMA_POW.municipality_of_death_literal,
+    SCHEMA_POW.date_of_going_mia,
+    SCHEMA_POW.place_of_going_mia_literal,
+    SCHEMA_POW.date_of_capture,
+    SCHEMA_POW.description_of_capture,
+    SCHEMA_POW.date_of_return,
+    SCHEMA_POW.date_of_death,
+    SCHEMA_POW.photograph,
+    SCHEMA_POW.radio_report,
+    SCHEMA_POW.finnish_return_interrogation_file,
+    SCHEMA_POW.recording,
+]
+
+
+# Privacy policy for person records. Can be overridden with a JSON file having some of the same keys, properties given
+# as full URIs and dates as YYYY-MM-DD.
+PRIVACY_POLICY = {
+    # Health information is hidden for persons who died less than this many years ago, or whose death date is unknown
+    'death_years': 50,
+    # Personal information is hidden for persons without a death record who were born on or after this date
+    'birth_cutoff': date(1910, 9, 30),
+    'health_properties': HEALTH_PROPERTIES,
+    'personal_properties': PERSONAL_PROPERTIES,
+}
+
+DIED_RECENTLY = 'died_recently'
+POSSIBLY_ALIVE = 'possibly_alive'
+DIED_LONG_AGO = 'died_long_ago'
+NO_RESTRICTIONS = 'no_restrictions'
+
+
+def load_policy(policy_file: str):
+    """
+    Read privacy policy from a JSON file, using the default policy for missing keys
 
-    try:
-        cast = parser.parse(datestr).date()
-    except ValueError:
-        try:
-            cast = parser.parse(datestr[-4:]).date()
-        except ValueError:
-            log.warning('Bad date: %s' % orig_date)
+    :raises ValueError: for unknown keys or values of wrong type
+    """
+    with open(policy_file, encoding='UTF-8') as file:
+        overrides = json.load(file)
+
+    unknown = set(overrides) - set(PRIVACY_POLICY)
+    if unknown:
+        raise ValueError('Unknown privacy policy keys: {keys}'.format(keys=', '.join(sorted(unknown))))
+
+    policy = dict(PRIVACY_POLICY)
+    for (key, value) in overrides.items():
+        if key == 'death_years':
+            if type(value) is not int or value < 0:
+                raise ValueError('Privacy policy death_years must be a non-negative integer: {val}'.format(val=value))
+            policy[key] = value
+        elif key == 'birth_cutoff':
+            try:
+                policy[key] = datetime.strptime(value, '%Y-%m-%d').date()
+            except (TypeError, ValueError):
+                raise ValueError('Privacy policy birth_cutoff must be a date as YYYY-MM-DD: {val}'.format(val=value))
+        else:
+            if not isinstance(value, list) or not all(isinstance(prop, str) for prop in value):
+                raise ValueError('Privacy policy {key} must be a list of property URIs: {val}'.format(
+                    key=key, val=value))
+            policy[key] = [URIRef(prop) for prop in value]
 
-    return cast
+    return policy
 
 
-def remove_triples_and_reifications(graph: Graph, triples: list):
+def person_attributes(graph: Graph):
     """
-    Remove triples and related reifications from graph
+    Get the attributes of person records needed for the privacy policy, as a DataFrame indexed by person.
+    Dates are given as ordinals (see datetime.date.toordinal), with missing dates as NaN.
+
+    :return: DataFrame with columns death_date (latest death date), death_without_date (whether any death date is
+             not a date), death_dates (number of valid death dates) and birth_date (latest birth date)
     """
-    for triple in triples:
-        log.debug('Removing triple and its reifications:  {spo}'.format(spo=str(triple)))
-        reifications = get_triple_reifications(graph, triple)
+    casted = {}
 
-        for reification in reifications:
-            graph.remove(reification)
+    def date_ordinals(prop):
+        records = []
+        for (person, _, value) in graph.triples((None, prop, None)):
+            if value not in casted:
+                parsed = cast_date(value)
+                casted[value] = parsed.toordinal() if parsed else np.nan
+            records.append((person, casted[value]))
+        return pd.DataFrame(records, columns=['person', 'date'], dtype=object).astype({'date': float})
+
+    persons = pd.Index(list(graph.subjects(RDF.type, SCHEMA_WARSA.PrisonerRecord)), name='person', dtype=object)
+
+    deaths = date_ordinals(SCHEMA_POW.date_of_death).groupby('person')['date']
+    births = date_ordinals(SCHEMA_WARSA.date_of_birth).groupby('person')['date']
+
+    return pd.DataFrame({
+        'death_date': deaths.max(),
+        'death_without_date': deaths.size() > deaths.count(),
+        'death_dates': deaths.count(),
+        'birth_date': births.max(),
+    }).reindex(persons).fillna({'death_without_date': False, 'death_dates': 0}).astype(
+        {'death_without_date': bool, 'death_dates': int})
+
+
+def classify_persons(attributes: pd.DataFrame, policy: dict = PRIVACY_POLICY, today: date = None):
+    """
+    Classify person records by the privacy policy
+
+    :param attributes: DataFrame from person_attributes
+    :param today: date to evaluate the policy on, default is the current date
+    :return: Series of DIED_RECENTLY, POSSIBLY_ALIVE, DIED_LONG_AGO or NO_RESTRICTIONS, indexed by person
+    """
+    today = today or date.today()
+    death_limit = (today - relativedelta(years=policy['death_years'])).toordinal()
+
+    died_recently = (attributes['death_date'] >= death_limit) | attributes['death_without_date']
+    has_death = attributes['death_date'].notna() | attributes['death_without_date']
+    possibly_alive = ~has_death & (attributes['birth_date'] >= policy['birth_cutoff'].toordinal())
+
+    return pd.Series(np.select([died_recently, possibly_alive, has_death],
+                               [DIED_RECENTLY, POSSIBLY_ALIVE, DIED_LONG_AGO], NO_RESTRICTIONS),
+                     index=attributes.index)
 
+
+def collect_triples(graph: Graph, subjects: set, properties: list):
+    """
+    Collect the triples of given properties of given subjects, with one lookup per property
+
+    :param subjects: set of subject URIs
+    :param properties: list of property URIs
+    :return: list of triples
+    """
+    subjects = set(subjects)
+    return [(s, p, o) for prop in properties for (s, p, o) in graph.triples((None, prop, None)) if s in subjects]
+
+
+def remove_triples_and_reifications(graph: Graph, triples: list, index: ReificationIndex = None):
+    """
+    Remove triples and related reifications from graph. In a ConjunctiveGraph the triples are also removed from their
+    source graphs.
+
+    :param index: reification index of the graph, for removing many triples. Without it the reifications of each
+                  triple are looked up separately.
+    """
+    log.debug('Removing {num} triples and their reifications'.format(num=len(triples)))
+    if index is not None:
+        index.remove_triples(triples)
+        return graph
+
+    for triple in triples:
+        for reification in triple_reifications(graph, triple):
+            graph.remove(reification)
         graph.remove(triple)
 
     return graph
 
 
-def hide_health_information(graph: Graph, person: URIRef):
+def hide_health_information(graph: Graph, persons: list, index: ReificationIndex = None,
+                            properties: list = HEALTH_PROPERTIES):
     """
-    Hide health information of a person record
+    Hide health information of person records
     """
-    triples = list(graph.triples((person, SCHEMA_POW.cause_of_death, None)))
-    triples += list(graph.triples((person, SCHEMA_POW.additional_information, None)))
+    triples = collect_triples(graph, persons, properties)
 
-    graph = remove_triples_and_reifications(graph, triples)
+    graph = remove_triples_and_reifications(graph, triples, index)
 
     return graph
 
 
-def hide_personal_information(graph: Graph, person: URIRef, common_names: list):
+def hide_personal_information(graph: Graph, persons: list, common_names: set, index: ReificationIndex = None,
+                              properties: list = PERSONAL_PROPERTIES):
     """
-    Hide personal information of a person record
+    Hide personal information of person records. Uncommon family names are replaced with 'Nimi rajoitettu', and
+    names are removed from the labels of captivities. Of several family names of a person, the alphabetically
+    first one is used.
     """
-    triples = list(graph.triples((person, SCHEMA_WARSA.given_names, None)))
-    triples += list(graph.triples((person, SCHEMA_POW.original_name, None)))
-    triples += list(graph.triples((person, SKOS.prefLabel, None)))
-    triples += list(graph.triples((person, SCHEMA_WARSA.date_of_birth, None)))
-    triples += list(graph.triples((person, SCHEMA_WARSA.municipality_of_birth_literal, None)))
-    triples += list(graph.triples((person, SCHEMA_POW.municipality_of_domicile_literal, None)))
-    triples += list(graph.triples((person, SCHEMA_POW.municipality_of_residence_literal, None)))
-    triples += list(graph.triples((person, SCHEMA_POW.municipality_of_death_literal, None)))
-    triples += list(graph.triples((person, SCHEMA_POW.date_of_going_mia, None)))
-    triples += list(graph.triples((person, SCHEMA_POW.place_of_going_mia_literal, None)))
-    triples += list(graph.triples((person, SCHEMA_POW.date_of_capture, None)))
-    triples += list(graph.triples((person, SCHEMA_POW.description_of_capture, None)))
-    triples += list(graph.triples((person, SCHEMA_POW.date_of_return, None)))
-    triples += list(graph.triples((person, SCHEMA_POW.date_of_death, None)))
-    triples += list(graph.triples((person, SCHEMA_POW.photograph, None)))
-    triples += list(graph.triples((person, SCHEMA_POW.radio_report, None)))
-    triples += list(graph.triples((person, SCHEMA_POW.finnish_return_interrogation_file, None)))
-    triples += list(graph.triples((person, SCHEMA_POW.recording, None)))
-
-    family_name = str(graph.value(person, SCHEMA_WARSA.family_name))
-
-    if family_name not in common_names:
-        log.info('Hiding family name %s of record %s' % (family_name, person))
-
-        triples += list(graph.triples((person, SCHEMA_WARSA.family_name, None)))
-
-        graph.add((person, SCHEMA_WARSA.family_name, Literal("Nimi rajoitettu")))
-        graph.add((person, SKOS.prefLabel, Literal("Nimi rajoitettu")))
-    else:
-        graph.add((person, SKOS.prefLabel, graph.value(person, SCHEMA_WARSA.family_name)))
-
-    captivities = list(graph.objects(person, SCHEMA_POW.captivity))
-
-    for captivity in captivities:
+    common_names = set(common_names)
+    persons = set(persons)
+
+    triples = collect_triples(graph, persons, properties)
+    family_names = {}
+    for (person, _, family_name) in collect_triples(graph, persons, [SCHEMA_WARSA.family_name]):
+        family_names[person] = min(family_names.get(person, family_name), family_name, key=str)
+
+    captivities = collect_triples(graph, persons, [SCHEMA_POW.captivity])
+    triples += collect_triples(graph, {captivity for (_, _, captivity) in captivities}, [SKOS.prefLabel])
+
+    new_triples = []
+    for person in persons:
+        family_name = str(family_names.get(person))
+
+        if family_name not in common_names:
+            log.info('Hiding family name %s of record %s' % (family_name, person))
+
+            triples += list(graph.triples((person, SCHEMA_WARSA.family_name, None)))
+
+            new_triples.append((person, SCHEMA_WARSA.family_name, Literal("Nimi rajoitettu")))
+            new_triples.append((person, SKOS.prefLabel, Literal("Nimi rajoitettu")))
+        else:
+            new_triples.append((person, SKOS.prefLabel, family_names[person]))
+
+        new_triples.append((person, SCHEMA_POW.personal_information_removed, Literal(True)))
+
+    for (person, _, captivity) in captivities:
         log.debug('Removing name from captivity resource %s' % captivity)
-        triples += list(graph.triples((captivity, SKOS.prefLabel, None)))
+        family_name = str(family_names.get(person))
 
         captivity_label_fi = 'Henkilön sotavankeus' if family_name not in common_names else \
             'Henkilön {person} sotavankeus'.format(person=family_name)
         captivity_label_en = 'Person\'s captivity' if family_name not in common_names else \
             'Person\'s {person} captivity'.format(person=family_name)
 
-        graph.add((captivity, SKOS.prefLabel, Literal(captivity_label_fi)))
-        graph.add((captivity, SKOS.prefLabel, Literal(captivity_label_en)))
+        new_triples.append((captivity, SKOS.prefLabel, Literal(captivity_label_fi)))
+        new_triples.append((captivity, SKOS.prefLabel, Literal(captivity_label_en)))
 
-    graph = remove_triples_and_reifications(graph, triples)
-
-    graph.add((person, SCHEMA_POW.personal_information_removed, Literal(True)))
+    graph = remove_triples_and_reifications(graph, triples, index)
+    graph.addN((s, p, o, default_graph(graph)) for (s, p, o) in new_triples)
 
     return graph
 
 
-def fetch_common_names(prisoner_familynames: list, endpoint: str):
+def fetch_family_name_counts(endpoint: str, cache: ResponseCache = None, refresh: bool = False):
     """
-    Retrieve common names from endpoint, combine them with persons list and return them as a list
+    Retrieve the number of persons with each family name that is used at least twice in the endpoint
+
+    :param cache: ResponseCache for the query
+    :param refresh: query the endpoint even if the response is cached, replacing the cached response
+
+    :return: dict of family name counts
     """
     NAME_QUERY = '''PREFIX foaf: <http://xmlns.com/foaf/0.1/>
         SELECT ?fam ?count WHERE {
@@ -160,75 +304,102 @@ def fetch_common_names(prisoner_familynames: list, endpoint: str):
         } ORDER BY ?fam
     '''
 
-    good_names = []
-    results = requests.post(endpoint, {'query': NAME_QUERY}).json()
+    def query():
+        return requests.post(endpoint, {'query': NAME_QUERY}).json()
+
+    results = cache.cached(endpoint, NAME_QUERY, query, refresh=refresh) if cache else query()
+
+    return {result['fam']['value']: int(result['count']['value']) for result in results['results']['bindings']}
 
-    for result in results['results']['bindings']:
-        family_name = result['fam']['value']
-        count = int(result['count']['value'])
 
-        if count + prisoner_familynames.count(family_name) >= 4:
+def load_family_name_counts(endpoint: str, snapshot: str = None, refresh: bool = False, cache: ResponseCache = None):
+    """
+    Get family name counts of the endpoint from a local snapshot file. The counts are retrieved from the endpoint and
+    stored to the snapshot if it does not exist or if refresh is requested.
+
+    :param snapshot: JSON file, or None to always query the endpoint
+    :param refresh: query the endpoint even if the snapshot exists or the response is cached
+    :param cache: ResponseCache for the endpoint query
+    :return: dict of family name counts
+    """
+    if snapshot and os.path.exists(snapshot) and not refresh:
+        with open(snapshot, encoding='UTF-8') as snapshot_file:
+            counts = json.load(snapshot_file)
+        log.info('Read {num} family name counts from snapshot {file}'.format(num=len(counts), file=snapshot))
+        return counts
+
+    counts = fetch_family_name_counts(endpoint, cache, refresh)
+
+    if snapshot:
+        with open(snapshot + '.tmp', 'w', encoding='UTF-8') as snapshot_file:
+            json.dump(counts, snapshot_file, ensure_ascii=False, indent=0, sort_keys=True)
+        os.replace(snapshot + '.tmp', snapshot)  # A partially written snapshot is never read
+        log.info('Stored {num} family name counts to snapshot {file}'.format(num=len(counts), file=snapshot))
+
+    return counts
+
+
+def fetch_common_names(prisoner_familynames: list, endpoint: str, snapshot: str = None, refresh: bool = False,
+                       cache: ResponseCache = None):
+    """
+    Retrieve common names from endpoint (or its local snapshot), combine them with persons list and return them as a
+    list
+    """
+    prisoner_counts = Counter(prisoner_familynames)
+
+    good_names = []
+    for family_name, count in sorted(load_family_name_counts(endpoint, snapshot, refresh, cache).items()):
+        if count + prisoner_counts[family_name] >= 4:
             good_names.append(family_name)
             log.debug('Declared %s as a common family name (hits %s + %s)' %
-                      (family_name, count, prisoner_familynames.count(family_name)))
+                      (family_name, count, prisoner_counts[family_name]))
 
     return good_names
 
 
-def prune_persons(graph: Graph, endpoint: str):
+def prune_persons(graph: Graph, endpoint: str, names_snapshot: str = None, refresh_names: bool = False,
+                  policy: dict = PRIVACY_POLICY, cache: ResponseCache = None):
     """
     Hide information of people in graph if needed
+
+    :param names_snapshot: local snapshot file of family name counts of the endpoint
+    :param refresh_names: update the snapshot from the endpoint
+    :param policy: privacy policy, see PRIVACY_POLICY
+    :param cache: ResponseCache for the family name query
     """
     familynames = [str(name) for name in graph.objects(None, SCHEMA_WARSA.family_name)]
-    common_names = fetch_common_names(familynames, endpoint)
+    common_names = fetch_common_names(familynames, endpoint, names_snapshot, refresh_names, cache)
 
-    persons = list(graph.subjects(RDF.type, SCHEMA_WARSA.PrisonerRecord))
+    attributes = person_attributes(graph)
 
-    log.info('Got %s person records for pruning' % len(persons))
-    died_recently = []
-    possibly_alive = []
-    n_public = 0
+    log.info('Got %s person records for pruning' % len(attributes))
+    for person in attributes.index[attributes['death_dates'] > 1]:
+        log.info('Multiple death dates for %s  (using latest)' % person)
 
     # Identify people who might have died less than 50 years age, and who might still be alive
 
-    for person in persons:
-        death_dates = list(graph.objects(person, SCHEMA_POW.date_of_death))
-        death_dates = [cast_date(d) for d in death_dates]
-
-        death_without_date = any(True for d in death_dates if d is None)
-        death_dates = [d for d in death_dates if d is not None]
-
-        if len(death_dates) > 1:
-            log.info('Multiple death dates for %s  (using latest)' % person)
+    classes = classify_persons(attributes, policy)
+    died_recently = list(classes.index[classes == DIED_RECENTLY])
+    possibly_alive = list(classes.index[classes == POSSIBLY_ALIVE])
 
-        death_date = sorted(death_dates)[-1] if death_dates else None
-
-        if (death_date and (death_date >= date.today() - relativedelta(years=50))) or death_without_date:
-            died_recently.append(person)
-        else:
-            if not (death_date or death_without_date):
-                dob = graph.value(person, SCHEMA_WARSA.date_of_birth)
-                if dob and cast_date(dob) >= date(1910, 9, 30):
-                    possibly_alive.append(person)
-            else:
-                log.debug('Person record with death date %s declared public')
-                n_public += 1
+    index = ReificationIndex(graph)
 
     # Health information is hidden
 
-    for person in died_recently + possibly_alive:
-        log.debug('Hiding health information of %s' % person)
-        graph = hide_health_information(graph, person)
-        graph.add((person, SCHEMA_POW.hide_documents, Literal(True)))
+    log.debug('Hiding health information of %s persons' % len(died_recently + possibly_alive))
+    graph = hide_health_information(graph, died_recently + possibly_alive, index, policy['health_properties'])
+    graph.addN((person, SCHEMA_POW.hide_documents, Literal(True), default_graph(graph))
+               for person in died_recently + possibly_alive)
 
     # Personal information is hidden
 
-    for person in possibly_alive:
-        log.debug('Hiding personal information of %s' % person)
-        graph = hide_personal_information(graph, person, common_names)
+    log.debug('Hiding personal information of %s persons' % len(possibly_alive))
+    graph = hide_personal_information(graph, possibly_alive, common_names, index, policy['personal_properties'])
 
-    log.info('Persons that have died more than 50 years ago: %s' % n_public)
-    log.info('Persons suspected to have died less than 50 years ago: %s' % len(died_recently))
+    log.info('Persons that have died more than {years} years ago: {num}'.format(
+        years=policy['death_years'], num=(classes == DIED_LONG_AGO).sum()))
+    log.info('Persons suspected to have died less than {years} years ago: {num}'.format(
+        years=policy['death_years'], num=len(died_recently)))
     log.info('Persons that might be alive: %s' % len(possibly_alive))
 
     return graph
@@ -236,9 +407,23 @@ def prune_persons(graph: Graph, endpoint: str):
 
 if __name__ == "__main__":
     argparser = argparse.ArgumentParser(description=__doc__, fromfile_prefix_chars='@')
-    argparser.add_argument("input", help="Input RDFfile")
-    argparser.add_argument("output", help="Output RDF file")
+    argparser.add_argument("input", help="Input RDF file, source annotations as reifications or named graphs")
+    argparser.add_argument("output", help="Output RDF file, source annotations as named graphs for .nq and .trig")
     argparser.add_argument("--endpoint", default='http://localhost:3030/warsa/sparql', help="SPARQL Endpoint")
+    argparser.add_argument("--names-snapshot", default=None,
+                           help="Local snapshot (JSON) of family name counts of the endpoint. "
+                                "Created from the endpoint if missing, and used instead of the endpoint if present.")
+    argparser.add_argument("--refresh-names", action='store_true',
+                           help="Update the family name snapshot and its cached response from the endpoint")
+    argparser.add_argument("--policy", default=None,
+                           help="Privacy policy JSON file overriding parts of the default policy (PRIVACY_POLICY)")
+    argparser.add_argument("--response-cache", help="Response cache file (SQLite) for SPARQL queries")
+    argparser.add_argument("--cache-ttl", default=None, type=float,
+                           help="Time to live of cached responses in seconds, default is no expiry")
+    argparser.add_argument("--replay", action='store_true',
+                           help="Only use cached responses, failing on queries that are not in the response cache")
+    argparser.add_argument("--invalidate-cache", action='store_true',
+                           help="Remove all cached responses before querying")
     argparser.add_argument("--logfile", default='tasks.log', help="Logfile")
     argparser.add_argument("--loglevel", default='INFO', help="Logging level, default is INFO.",
                            choices=["NOTSET", "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"])
@@ -250,8 +435,15 @@ if __name__ == "__main__":
     log.addHandler(log_handler)
     log.setLevel(args.loglevel)
 
-    g = Graph()
+    g = read_graph(args.input, expand=False)
+
+    policy = load_policy(args.policy) if args.policy else PRIVACY_POLICY
 
-    g.parse(args.input, format='turtle')
+    cache = ResponseCache(args.response_cache, args.cache_ttl, args.replay) if args.response_cache else None
+    if cache and args.invalidate_cache:
+        cache.invalidate()
 
-    bind_namespaces(prune_persons(g, args.endpoint)).serialize(args.output, format=guess_format(args.output))
+    write_graph(bind_namespaces(prune_persons(g, args.endpoint, args.names_snapshot, args.refresh_names, policy,
+                                              cache)), args.output)
+    if cache:
+        cache.close()
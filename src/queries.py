@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Concurrent querying (ARPA, SPARQL) with a limited number of concurrent queries, timeouts and retries
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+log = logging.getLogger(__name__)
+
+
+class QueryTimeout(requests.Timeout):
+    """
+    Query did not finish in time
+    """
+
+
+def is_retryable(error):
+    """
+    Client errors (HTTP 4xx) are not worth retrying, other errors are
+    """
+    response = getattr(error, 'response', None)
+    return not (isinstance(error, requests.HTTPError) and response is not None and response.status_code < 500)
+
+
+class QueryExecutor:
+    """
+    Run queries concurrently, at most max_connections at a time. Queries that fail or time out are retried with
+    exponential backoff.
+    """
+
+    def __init__(self, max_connections=4, timeout=60, retries=3, backoff=1.0):
+        """
+        :param max_connections: maximum number of concurrent queries
+        :param timeout: timeout of a single query in seconds, or None for no timeout
+        :param retries: number of retries of a failed query
+        :param backoff: wait before the first retry in seconds, doubled for each further retry
+        """
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+    def _run(self, func, args, kwargs):
+        """
+        Call a query function once, raising QueryTimeout if it does not return in time. The query functions (e.g. ARPA
+        queries of arpa_linker) do not take a timeout, so the call is made in a daemon thread that is abandoned on
+        timeout.
+        """
+        if not self.timeout:
+            return func(*args, **kwargs)
+
+        outcome = {}
+
+        def run():
+            try:
+                outcome['result'] = func(*args, **kwargs)
+            except Exception as e:
+                outcome['error'] = e
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        thread.join(self.timeout)
+        if thread.is_alive():
+            raise QueryTimeout('Query did not finish in {timeout} seconds'.format(timeout=self.timeout))
+        if 'error' in outcome:
+            raise outcome['error']
+
+        return outcome['result']
+
+    def call(self, func, *args, **kwargs):
+        """
+        Call a query function with the timeout, retrying it with exponential backoff if it raises an exception or
+        times out. Client errors (HTTP 4xx) are not retried.
+
+        :return: return value of func
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                return self._run(func, args, kwargs)
+            except Exception as e:
+                if attempt == self.retries or not is_retryable(e):
+                    raise
+                wait = self.backoff * 2 ** attempt
+                log.warning('Query failed ({err}), retrying in {wait} seconds'.format(err=e, wait=wait))
+                time.sleep(wait)
+
+    def map(self, func, values):
+        """
+        Call a query function concurrently for each distinct value
+
+        :param func: function taking a single value
+        :param values: iterable of hashable values
+        :return: dict of results by value
+        """
+        values = list(dict.fromkeys(values))
+        if self.max_connections <= 1 or len(values) <= 1:
+            return {value: self.call(func, value) for value in values}
+
+        with ThreadPoolExecutor(max_workers=self.max_connections) as pool:
+            futures = [pool.submit(self.call, func, value) for value in values]
+            return {value: future.result() for value, future in zip(values, futures)}
+
+
+def call_query(executor, func, *args, **kwargs):
+    """
+    Call a query function through the executor, with its timeout and retries, or directly if there is no executor
+    """
+    if executor is None:
+        return func(*args, **kwargs)
+
+    return executor.call(func, *args, **kwargs)
+
+
+def prefetch_queries(arpa, values, executor):
+    """
+    Run ARPA queries of given values concurrently, and make the ARPA instance answer them from the results.
+    Other values are still queried one at a time, with the timeout and retries of the executor.
+
+    :param arpa: ARPA (or ArpaMimic) instance
+    :param values: values to query
+    :param executor: QueryExecutor
+    :return: arpa
+    """
+    query = arpa.query
+    results = executor.map(query, values)
+    log.info('Prefetched ARPA results of {num} values'.format(num=len(results)))
+
+    def prefetched_query(text, *args, **kwargs):
+        if not (args or kwargs) and text in results:
+            return results[text]
+        return executor.call(query, text, *args, **kwargs)
+
+    arpa.query = prefetched_query
+
+    return arpa
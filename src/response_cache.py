@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+On-disk cache of ARPA and SPARQL responses, keyed by endpoint, query and parameters
+"""
+import hashlib
+import json
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+
+from rdflib import Graph
+
+log = logging.getLogger(__name__)
+
+
+class ReplayMiss(KeyError):
+    """
+    Response is not in the cache, and the cache is in replay-only mode
+    """
+
+
+class ResponseCache:
+    """
+    SQLite backed cache of query responses. Responses older than the TTL are queried again, except in replay-only mode
+    where all responses come from the cache.
+    """
+
+    def __init__(self, path, ttl=None, replay=False):
+        """
+        :param path: SQLite file
+        :param ttl: time to live of responses in seconds, or None for no expiry
+        :param replay: only use cached responses, raising ReplayMiss for others
+        """
+        self.path = path
+        self.ttl = ttl
+        self.replay = replay
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS responses '
+                                '(key TEXT PRIMARY KEY, endpoint TEXT, created REAL, response BLOB)')
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(endpoint, query, params=None):
+        key = json.dumps([endpoint, query, params], sort_keys=True, default=str)
+        return hashlib.sha1(key.encode('UTF-8')).hexdigest()
+
+    def get(self, endpoint, query, params=None):
+        """
+        :return: cached response
+        :raises KeyError: if the response is not cached or has expired
+        """
+        with self.lock:
+            row = self.connection.execute('SELECT created, response FROM responses WHERE key = ?',
+                                          (self.key(endpoint, query, params),)).fetchone()
+        if row is None or (self.ttl is not None and not self.replay and time.time() - row[0] > self.ttl):
+            raise KeyError(query)
+
+        return pickle.loads(row[1])
+
+    def put(self, endpoint, query, response, params=None):
+        with self.lock:
+            self.connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)',
+                                    (self.key(endpoint, query, params), endpoint, time.time(),
+                                     pickle.dumps(response)))
+            self.connection.commit()
+
+    def cached(self, endpoint, query, func, params=None, refresh=False):
+        """
+        Get a response from the cache, or by calling func and caching its return value
+
+        :param func: function without arguments making the query
+        :param refresh: call func and replace the cached response even if it has not expired (except in replay mode)
+        :return: response
+        """
+        if not refresh or self.replay:
+            try:
+                response = self.get(endpoint, query, params)
+                with self.lock:
+                    self.hits += 1
+                return response
+            except KeyError:
+                if self.replay:
+                    raise ReplayMiss('No cached response from {endpoint} for {query}'.format(
+                        endpoint=endpoint, query=query))
+
+        response = func()
+        self.put(endpoint, query, response, params)
+        with self.lock:
+            self.misses += 1
+
+        return response
+
+    def invalidate(self, endpoint=None):
+        """
+        Remove cached responses of an endpoint, or all cached responses
+        """
+        with self.lock:
+            if endpoint is None:
+                self.connection.execute('DELETE FROM responses')
+            else:
+                self.connection.execute('DELETE FROM responses WHERE endpoint = ?', (endpoint,))
+            self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+        log.info('Response cache {path}: {hits} responses reused, {misses} queried'.format(
+            path=self.path, hits=self.hits, misses=self.misses))
+
+
+def cache_queries(arpa, cache, endpoint, params=None):
+    """
+    Make an ARPA (or ArpaMimic) instance answer queries from the response cache
+
+    :param params: parameters that affect the responses besides the query text, e.g. a SPARQL query template
+    :return: arpa
+    """
+    query = arpa.query
+
+    def cached_query(text, *args, **kwargs):
+        key_params = dict(params or {}, args=list(args), kwargs=kwargs)
+        return cache.cached(endpoint, text, lambda: query(text, *args, **kwargs), key_params)
+
+    arpa.query = cached_query
+
+    return arpa
+
+
+def cached_graph(cache, endpoint, query, func):
+    """
+    Get an RDF graph from the response cache, or by calling func
+
+    :param cache: ResponseCache, or None to always call func
+    :param func: function without arguments returning an rdflib Graph
+    :return: rdflib Graph
+    """
+    if cache is None:
+        return func()
+
+    data = cache.cached(endpoint, query, lambda: func().serialize(format='nt'))
+    return Graph().parse(data=data, format='nt')
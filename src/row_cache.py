@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+On-disk cache of the triples and errors of converted CSV rows, keyed by row content hash
+"""
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+from functools import partial
+
+log = logging.getLogger(__name__)
+
+# Source files that affect the conversion result of a row
+CODE_FILES = ['csv_to_rdf.py', 'cell_parser.py', 'converters.py', 'dates.py', 'mapping.py', 'namespaces.py',
+              'validators.py']
+
+
+def _describe(value):
+    """
+    Describe a mapping value in a form that is stable between processes
+    """
+    if isinstance(value, dict):
+        return '{%s}' % ', '.join('%s: %s' % (_describe(key), _describe(val))
+                                  for key, val in sorted(value.items(), key=lambda item: str(item[0])))
+    if isinstance(value, partial):
+        return 'partial(%s, %s, %s)' % (_describe(value.func), _describe(list(value.args)),
+                                        _describe(value.keywords))
+    if isinstance(value, (list, tuple)):
+        return '[%s]' % ', '.join(_describe(val) for val in value)
+    if callable(value) and hasattr(value, '__qualname__'):
+        return '%s.%s' % (value.__module__, value.__qualname__)
+
+    return repr(value)
+
+
+def fingerprint(mapping, instance_class):
+    """
+    Fingerprint of the mapping and the conversion code. Cached rows are valid only for the same fingerprint.
+
+    :param mapping: column mapping, e.g. PRISONER_MAPPING
+    :param instance_class: class of the row instances
+    :return: hex digest
+    """
+    digest = hashlib.sha1()
+    digest.update(_describe(mapping).encode('UTF-8'))
+    digest.update(str(instance_class).encode('UTF-8'))
+
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    for filename in CODE_FILES:
+        with open(os.path.join(src_dir, filename), 'rb') as code:
+            digest.update(code.read())
+
+    return digest.hexdigest()
+
+
+class RowCache:
+    """
+    SQLite backed cache of converted rows. Rows that are not used in a conversion are removed when the cache is closed.
+    """
+
+    def __init__(self, path, mapping, instance_class):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS meta (fingerprint TEXT)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS rows (key TEXT PRIMARY KEY, triples BLOB, errors BLOB)')
+
+        current = fingerprint(mapping, instance_class)
+        stored = self.connection.execute('SELECT fingerprint FROM meta').fetchone()
+        if not stored or stored[0] != current:
+            if stored:
+                log.info('Mapping or conversion code has changed, invalidating row cache %s' % path)
+            self.connection.execute('DELETE FROM rows')
+            self.connection.execute('DELETE FROM meta')
+            self.connection.execute('INSERT INTO meta VALUES (?)', (current,))
+            self.connection.commit()
+
+        self.stored = {key for (key,) in self.connection.execute('SELECT key FROM rows')}
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def row_keys(table, prisoner_numbers):
+        """
+        Get content hashes of table rows. The column names are part of the keys, as they decide how the cells are
+        mapped.
+
+        :param table: pandas DataFrame
+        :param prisoner_numbers: prisoner numbers of the rows, which are part of the generated triples
+        :return: list of keys
+        """
+        header = hashlib.sha1(repr(tuple(table.columns)).encode('UTF-8')).hexdigest()
+        return [hashlib.sha1(repr((header, number, tuple(row))).encode('UTF-8')).hexdigest()
+                for number, row in zip(prisoner_numbers, table.itertuples(index=False, name=None))]
+
+    def __contains__(self, key):
+        return key in self.stored
+
+    def get(self, key):
+        """
+        :return: triples and errors of a cached row
+        """
+        (triples, errors) = self.connection.execute('SELECT triples, errors FROM rows WHERE key = ?', (key,)).fetchone()
+        self.used.add(key)
+        self.hits += 1
+        return pickle.loads(triples), pickle.loads(errors)
+
+    def put(self, key, triples, errors):
+        self.connection.execute('INSERT OR REPLACE INTO rows VALUES (?, ?, ?)',
+                                (key, pickle.dumps(list(triples)), pickle.dumps(errors)))
+        self.stored.add(key)
+        self.used.add(key)
+        self.misses += 1
+
+    def close(self):
+        """
+        Remove rows that were not used and write the cache to disk
+        """
+        self.connection.execute('CREATE TEMP TABLE used (key TEXT PRIMARY KEY)')
+        self.connection.executemany('INSERT INTO used VALUES (?)', ((key,) for key in self.used))
+        self.connection.execute('DELETE FROM rows WHERE key NOT IN (SELECT key FROM used)')
+        self.connection.commit()
+        self.connection.close()
+        log.info('Row cache {path}: {hits} rows reused, {misses} rows converted'.format(
+            path=self.path, hits=self.hits, misses=self.misses))
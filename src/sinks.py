@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Streaming RDF output
+"""
+import logging
+import re
+
+from rdflib import Graph, URIRef, Literal
+
+from namespaces import bind_namespaces
+
+log = logging.getLogger(__name__)
+
+LOCAL_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_-]*$')
+
+
+class TripleSink:
+    """
+    Write triples to a file as they are produced, instead of keeping them in a graph.
+
+    Every triple is written as its own statement, so the output is valid N-Triples (format 'nt') or Turtle
+    (format 'turtle', using the prefixes from bind_namespaces). Format 'nq' (N-Quads) also accepts quads, which
+    are written to their named graphs.
+    """
+
+    def __init__(self, destination, fformat='nt'):
+        self.destination = destination
+        self.format = fformat
+        self.namespace_manager = bind_namespaces(Graph()).namespace_manager
+        self.file = open(destination, 'w', encoding='UTF-8')
+        self.count = 0
+
+        if fformat == 'turtle':
+            for prefix, namespace in sorted(self.namespace_manager.namespaces()):
+                self.file.write('@prefix {prefix}: <{ns}> .\n'.format(prefix=prefix, ns=namespace))
+            self.file.write('\n')
+
+    def term_n3(self, term):
+        """
+        Get term in a form that is valid in both N-Triples and Turtle
+        """
+        if isinstance(term, Literal):
+            value = '"{}"'.format(str(term).replace('\\', '\\\\').replace('"', '\\"')
+                                  .replace('\n', '\\n').replace('\r', '\\r'))
+            if term.language:
+                return '{value}@{lang}'.format(value=value, lang=term.language)
+            if term.datatype:
+                return '{value}^^<{datatype}>'.format(value=value, datatype=term.datatype)
+            return value
+
+        if self.format == 'turtle' and isinstance(term, URIRef):
+            try:
+                prefix, namespace, name = self.namespace_manager.compute_qname(term, generate=False)
+            except (KeyError, ValueError):
+                return term.n3()
+            if LOCAL_NAME.match(name):
+                return '{prefix}:{name}'.format(prefix=prefix, name=name)
+
+        return term.n3()
+
+    def add_triples(self, triples):
+        """
+        Write triples (or quads, if the format is 'nq') to the sink
+        """
+        for statement in triples:
+            if len(statement) == 4 and self.format != 'nq':
+                raise ValueError('Quads can only be written in N-Quads format, not {}'.format(self.format))
+            self.file.write(' '.join(self.term_n3(term) for term in statement) + ' .\n')
+            self.count += 1
+
+    def close(self):
+        self.file.close()
+        log.info('Wrote {num} triples to {dest}'.format(num=self.count, dest=self.destination))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
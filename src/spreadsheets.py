@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+#  -*- coding: UTF-8 -*-
+"""
+Read the original spreadsheets (Excel workbooks or CSV files) as string typed pandas DataFrames
+"""
+import datetime
+import logging
+import os
+from itertools import islice
+
+import openpyxl
+import pandas as pd
+import xlrd
+
+log = logging.getLogger(__name__)
+
+# Number of dummy rows before the header row and after the last data row in the original spreadsheets
+CROP = {
+    'PRISONERS': (0, 0),
+    'CAMPS': (3, 4),
+    'HOSPITALS': (0, 2),
+    'SOURCES': (1, 0),
+}
+
+
+def is_excel(table_input):
+    return isinstance(table_input, str) and os.path.splitext(table_input)[1].lower() in ('.xls', '.xlsx')
+
+
+def cell_to_str(value):
+    """
+    Format an Excel cell value as text, like a CSV export with cells as shown in the General number format and Finnish
+    date format. Cells with their own number formats (e.g. a fixed number of decimals) may differ from how they are
+    shown in the spreadsheet.
+
+    >>> cell_to_str(12.0)
+    '12'
+    >>> cell_to_str(0.1 + 0.2)
+    '0.3'
+    >>> cell_to_str(datetime.datetime(1942, 2, 1))
+    '01.02.1942'
+    >>> cell_to_str(datetime.datetime(1942, 2, 1, 12, 30))
+    '01.02.1942 12:30:00'
+
+    :return: string, or None for an empty cell
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() else '%.15g' % value
+    if isinstance(value, datetime.datetime) and value.time() != datetime.time():
+        return value.strftime('%d.%m.%Y %H:%M:%S')
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.strftime('%d.%m.%Y')
+
+    return str(value)
+
+
+def _xls_rows(path):
+    book = xlrd.open_workbook(path, on_demand=True)
+    try:
+        sheet = book.sheet_by_index(0)
+
+        for row in range(sheet.nrows):
+            values = []
+            for cell in sheet.row(row):
+                if cell.ctype == xlrd.XL_CELL_DATE:
+                    values.append(xlrd.xldate_as_datetime(cell.value, book.datemode))
+                elif cell.ctype == xlrd.XL_CELL_BOOLEAN:
+                    values.append(bool(cell.value))
+                elif cell.ctype == xlrd.XL_CELL_ERROR:
+                    values.append(None)
+                else:
+                    values.append(cell.value)
+            yield values
+    finally:
+        book.release_resources()
+
+
+def _xlsx_rows(path):
+    book = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from book.worksheets[0].iter_rows(values_only=True)
+    finally:
+        book.close()
+
+
+def excel_rows(path):
+    """
+    Read the rows of the first sheet of an Excel workbook one at a time
+
+    :param path: .xls or .xlsx file
+    :return: generator of lists of cell strings
+    """
+    rows = _xls_rows(path) if path.lower().endswith('.xls') else _xlsx_rows(path)
+    for row in rows:
+        yield [cell_to_str(value) for value in row]
+
+
+def column_names(header):
+    """
+    Make column names from a header row like pandas.read_csv does
+
+    >>> column_names([None, 'nimi', 'nimi'])
+    ['Unnamed: 0', 'nimi', 'nimi.1']
+    """
+    names = []
+    for index, name in enumerate(header):
+        name = 'Unnamed: {index}'.format(index=index) if name is None else name
+        unique_name = name
+        count = 0
+        while unique_name in names:
+            count += 1
+            unique_name = '{name}.{count}'.format(name=name, count=count)
+        names.append(unique_name)
+
+    return names
+
+
+def _excel_chunks(path, chunksize, skip_header):
+    rows = islice(excel_rows(path), skip_header, None)
+    names = column_names(next(rows, []))
+
+    empty = True
+    while True:
+        chunk = list(islice(rows, chunksize))
+        if not chunk:
+            if empty:
+                yield pd.DataFrame([], columns=names, dtype=object)
+            break
+        empty = False
+        chunk = [[None if cell == ' ' else cell for cell in (row + [None] * len(names))[:len(names)]]
+                 for row in chunk]
+        yield pd.DataFrame(chunk, columns=names, dtype=object)
+        if chunksize is None:
+            break
+
+
+def crop_footer(chunks, rows):
+    """
+    Leave out given number of rows from the end of a table read in chunks. If no rows are left, an empty chunk is
+    yielded.
+    """
+    pending = None
+    empty = True
+    for chunk in chunks:
+        if pending is not None:
+            chunk = pd.concat([pending, chunk])
+        split = max(len(chunk) - rows, 0)
+        if split:
+            yield chunk.iloc[:split]
+            empty = False
+        pending = chunk.iloc[split:]
+
+    if empty and pending is not None:
+        yield pending.iloc[:0]
+
+
+def limit_rows(chunks, nrows):
+    """
+    Take only given number of rows from a table read in chunks. If no rows are taken, an empty chunk is yielded.
+    """
+    for index, chunk in enumerate(chunks):
+        if nrows <= 0:
+            if not index:
+                yield chunk.iloc[:0]
+            break
+        yield chunk.iloc[:nrows]
+        nrows -= len(chunk)
+
+
+def read_chunks(table_input, chunksize=None, skip_header=0, skip_footer=0, nrows=None):
+    """
+    Read a table from an Excel workbook (first sheet) or a CSV file, with all cells as strings.
+    Empty cells are missing values. Excel workbooks are read one row at a time. A table without rows is read as an
+    empty chunk with the header columns.
+
+    :param table_input: .xls or .xlsx file, or CSV input (filename or buffer)
+    :param chunksize: number of rows in a chunk, or None to read the whole table as one chunk
+    :param skip_header: number of rows to skip before the header row
+    :param skip_footer: number of rows to skip in the end
+    :param nrows: number of rows to read, or None to read all rows
+    :return: generator of pandas DataFrames
+    """
+    if is_excel(table_input):
+        chunks = _excel_chunks(table_input, chunksize, skip_header)
+    else:
+        reader = pd.read_csv(table_input, encoding='UTF-8', index_col=False, sep=',', quotechar='"', dtype=str,
+                             na_values=[' '], skiprows=skip_header, chunksize=chunksize)
+        chunks = [reader] if chunksize is None else reader
+
+    if skip_footer:
+        chunks = crop_footer(chunks, skip_footer)
+    if nrows is not None:
+        chunks = limit_rows(chunks, nrows)
+
+    yield from chunks
+
+
+def read_table(table_input, skip_header=0, skip_footer=0, nrows=None):
+    """
+    Read a whole table from an Excel workbook or a CSV file, see read_chunks
+    """
+    return next(read_chunks(table_input, None, skip_header, skip_footer, nrows), pd.DataFrame(dtype=object))
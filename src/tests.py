@@ -7,18 +7,43 @@ To run all tests (including doctests) you can use for example nose: nosetests --
 """
 import datetime
 import io
+import json
+import os
+import pickle
+import socketserver
+import tempfile
+import threading
+import time
 import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from functools import partial
 from pprint import pprint, pformat
 
-from rdflib import Graph, URIRef, Literal, RDF
+import dedupe
+import openpyxl
+import pandas as pd
+import requests
+from rdflib import ConjunctiveGraph, Graph, URIRef, Literal, RDF, Namespace
 from rdflib.compare import isomorphic, graph_diff
 
 import converters
-from csv_to_rdf import RDFMapper, get_triple_reifications
-from linker import _generate_prisoners_dict
+import dates
+import validators
+from cell_parser import parse_value_with_source, parse_semicolon_separated, benchmark, BENCHMARK_CELLS
+from csv_to_rdf import RDFMapper, get_triple_reifications, convert_locations
+from linkage_model import load_settings, model_fingerprint, save_settings
+from linker import _generate_prisoners_dict, link, link_camps
 from mapping import PRISONER_MAPPING
 from namespaces import DATA_NS, DCT, SCHEMA_WARSA, SCHEMA_POW, RANKS_NS, SKOS, MUNICIPALITIES, SCHEMA_ACTORS, BIOC, ACTORS
-from prune_nonpublic import prune_persons
+from provenance import read_graph, write_graph, triple_sources, ReificationIndex
+from prisoners_pipeline import convert_and_prune
+from queries import QueryExecutor, QueryTimeout
+from response_cache import ResponseCache, ReplayMiss, cache_queries, cached_graph
+from prune_nonpublic import prune_persons, hide_personal_information, fetch_common_names, person_attributes, \
+    classify_persons, load_policy, PRIVACY_POLICY
+from row_cache import RowCache
+from sinks import TripleSink
+from spreadsheets import read_chunks, read_table
 
 
 class TestConverters(unittest.TestCase):
@@ -31,6 +56,16 @@ class TestConverters(unittest.TestCase):
         self.assertEqual(converters.convert_dates('xx.xx.xxxx'), 'xx.xx.xxxx')
         self.assertEqual(converters.convert_dates('xx.09.2016'), 'xx.09.2016')
 
+    def test_parse_date(self):
+        self.assertEqual(dates.parse_date('24/12/2016'), dates.PartialDate(2016, 12, 24))
+        self.assertEqual(dates.parse_date('xx.09.2016'), dates.PartialDate(2016, 9, None))
+        self.assertEqual(dates.parse_date('xx.xx.xxxx'), dates.PartialDate(None, None, None))
+        self.assertIsNone(dates.parse_date('xx.09.2016').date)
+        self.assertIsNone(dates.parse_date('30.02.2016'))
+
+        self.assertEqual(dates.date_value(Literal(datetime.date(1906, 12, 23))), '1906-12-23')
+        self.assertIsNone(dates.date_value(Literal('xx.12.1906')))
+
     def test_convert_person_name(self):
         self.assertEqual(converters.convert_person_name('Virtanen Matti Akseli'),
                          ('Matti Akseli', 'Virtanen', 'Virtanen, Matti Akseli'))
@@ -44,32 +79,76 @@ class TestConverters(unittest.TestCase):
         self.assertEqual(converters.convert_person_name('Ahjo ent. Germanoff Juho ent. Ivan'),
                          ('Juho Ent. Ivan', 'Ahjo (ent. Germanoff)', 'Ahjo (ent. Germanoff), Juho Ent. Ivan'))
 
+    def test_convert_person_names(self):
+        names = ['Virtanen Matti Akseli', 'Huurre ent. Hildén Aapo Antero', 'Virtanen Matti Akseli']
+        self.assertEqual(converters.convert_person_names(names),
+                         [converters.convert_person_name(name) for name in names])
+
+        converters.convert_person_name.cache_clear()
+        converters.convert_person_names(names)
+        self.assertEqual(converters.convert_person_name.cache_info().misses, 2)
+
     def test_strip_dash(self):
         self.assertEqual(converters.strip_dash('-'), '')
         self.assertEqual(converters.strip_dash('Foo-Bar'), 'Foo-Bar')
 
 
+class TestValidators(unittest.TestCase):
+    def test_validate_dates_column(self):
+        original = pd.Series(['1.1.1940', '1.1.1939', 'xx.1.1942', '1.1.1950', '1/1/1940', 'n.1918', ''],
+                             index=[0, 0, 1, 1, 2, 3, 3])
+        resolved = original.map(converters.convert_dates)
+        numbers = pd.Series(['1', '2', '3', '4'])
+        names = pd.Series(['A', 'B', 'C', 'D'])
+
+        errors = validators.validate_dates_column(resolved, original, 'syntymäaika', numbers, names)
+
+        self.assertEqual(list(errors.columns), ['nro', 'nimi', 'sarake', 'virhe', 'arvo'])
+        self.assertEqual(errors.values.tolist(), [
+            ['1', 'A', 'syntymäaika', 'Päivämäärä 1939-01-01 liian varhainen (< 1939-11-28)', '1.1.1939'],
+            ['2', 'B', 'syntymäaika', 'Päivämäärä 1950-01-01 liian myöhäinen (> 1945-04-25)', '1.1.1950'],
+            ['4', 'D', 'syntymäaika', 'Päivämäärä ei ole kelvollinen', 'n.1918'],
+        ])
+        self.assertEqual(errors['virhe'].tolist(),
+                         [e for e in map(validators.validate_dates, resolved, original) if e])
+
+    def test_column_validator(self):
+        validator = validators.column_validator(partial(validators.validate_dates, before=datetime.date(1960, 1, 1)))
+        errors = validator(pd.Series([datetime.date(1950, 1, 1)]), pd.Series(['1.1.1950']))
+        self.assertTrue(errors.empty)
+
+        validator = validators.column_validator(lambda resolved, original: 'Virhe' if resolved == 'b' else None)
+        errors = validator(pd.Series(['a', 'b']), pd.Series(['a', 'b']), 'sarake')
+        self.assertEqual(errors[['sarake', 'virhe', 'arvo']].values.tolist(), [['sarake', 'Virhe', 'b']])
+
+
 class TestRDFMapper(unittest.TestCase):
     def test_read_value_with_source(self):
-        mapper = RDFMapper({}, '')
-
-        self.assertEqual(mapper.read_value_with_source('Some text'), ('Some text', [], ''))
-        self.assertEqual(mapper.read_value_with_source('Some text (source A)'), ('Some text', ['source A'], ''))
-        self.assertEqual(mapper.read_value_with_source('Some text (source A, source B)'), ('Some text',
-                                                                                           ['source A, source B'], ''))
+        self.assertEqual(parse_value_with_source('Some text'), ('Some text', [], None, None, []))
+        self.assertEqual(parse_value_with_source('Some text (source A)'), ('Some text', ['source A'], None, None, []))
+        self.assertEqual(parse_value_with_source('Some text (source A, source B)'),
+                         ('Some text', ['source A, source B'], None, None, []))
+        self.assertEqual(parse_value_with_source('Some text (source A) trash'),
+                         ('Some text (source A) trash', ['source A'], None, None,
+                          ['Ylimääräisiä merkintöjä suluissa annetun lähteen jälkeen: Some text (source A) trash']))
 
     def test_read_semicolon_separated(self):
-        mapper = RDFMapper({}, '')
+        self.assertEqual(parse_semicolon_separated('Some text'), ('Some text', [], None, None, []))
+        self.assertEqual(parse_semicolon_separated('Source: Value'), ('Value', ['Source'], None, None, []))
+        self.assertEqual(parse_semicolon_separated('Source1, Source2: Value'),
+                         ('Value', ['Source1, Source2'], None, None, []))
+        self.assertEqual(parse_semicolon_separated('http://example.com/'),
+                         ('http://example.com/', [], None, None, []))
+
+        self.assertEqual(parse_semicolon_separated('54 13.10.1942-xx.11.1942'),
+                         ('54', [], datetime.date(1942, 10, 13), 'xx.11.1942', []))
 
-        self.assertEquals(mapper.read_semicolon_separated('Some text'), ('Some text', [], None, None, []))
-        self.assertEquals(mapper.read_semicolon_separated('Source: Value'), ('Value', ['Source'], None, None, []))
-        self.assertEquals(mapper.read_semicolon_separated('Source1, Source2: Value'),
-                          ('Value', ['Source1, Source2'], None, None, []))
-        self.assertEquals(mapper.read_semicolon_separated('http://example.com/'),
-                          ('http://example.com/', [], None, None, []))
+    def test_cell_parsers(self):
+        for (name, cells, legacy, parser) in BENCHMARK_CELLS:
+            for cell in cells:
+                self.assertEqual(parser(cell), legacy(cell), cell)
 
-        self.assertEquals(mapper.read_semicolon_separated('54 13.10.1942-xx.11.1942'),
-                          ('54', [], datetime.date(1942, 10, 13), 'xx.11.1942', []))
+        self.assertEqual([name for (name, _, _) in benchmark(1)], [name for (name, _, _, _) in BENCHMARK_CELLS])
 
     def test_read_csv_simple_2(self):
         mapper = RDFMapper({}, '')
@@ -99,6 +178,199 @@ class TestRDFMapper(unittest.TestCase):
 
         assert isomorphic(g, g2)  # Isomorphic graph comparison
 
+    def prisoner_mapper(self, mapping=PRISONER_MAPPING, **kwargs):
+        """
+        Prisoner record mapper with the test prisoners read and preprocessed
+        """
+        mapper = RDFMapper(mapping, URIRef(SCHEMA_WARSA.PrisonerRecord), **kwargs)
+        mapper.read_csv('test_data/prisoners.csv')
+        mapper.preprocess_prisoners_data()
+        return mapper
+
+    def test_process_columns(self):
+        row_mapper = self.prisoner_mapper()
+        row_mapper.process_rows()
+
+        column_mapper = self.prisoner_mapper()
+        column_mapper.process_columns()
+
+        assert isomorphic(row_mapper.data, column_mapper.data)
+        self.assertEqual(row_mapper.errors, column_mapper.errors)
+        assert isomorphic(row_mapper.schema, column_mapper.schema)
+
+    def test_validate(self):
+        mapper = self.prisoner_mapper()
+        mapper.process_rows()
+
+        for workers in [1, 2]:
+            validating_mapper = self.prisoner_mapper()
+            validating_mapper.validate(workers=workers)
+
+            self.assertEqual(mapper.errors, validating_mapper.errors)
+            self.assertEqual(len(validating_mapper.data), 0)
+
+    def test_process_rows_workers(self):
+        mapper = self.prisoner_mapper()
+        mapper.process_rows()
+
+        parallel_mapper = self.prisoner_mapper()
+        parallel_mapper.process_rows(workers=2)
+
+        assert isomorphic(mapper.data, parallel_mapper.data)
+        self.assertEqual(mapper.errors, parallel_mapper.errors)
+
+    def test_process_rows_to_sink(self):
+        mapper = self.prisoner_mapper()
+        mapper.process_rows()
+
+        for fformat in ['nt', 'turtle']:
+            with tempfile.TemporaryDirectory() as tempdir:
+                destination = os.path.join(tempdir, 'prisoners.' + fformat)
+                with TripleSink(destination, fformat) as sink:
+                    streaming_mapper = self.prisoner_mapper(sink=sink)
+                    streaming_mapper.process_rows()
+
+                self.assertEqual(len(streaming_mapper.data), 0)
+                assert isomorphic(mapper.data, Graph().parse(destination, format=fformat))
+
+    def test_read_excel(self):
+        mapper = RDFMapper(PRISONER_MAPPING, '')
+        mapper.read_csv('test_data/prisoners.csv')
+
+        workbook = openpyxl.Workbook()
+        workbook.active.append(['Otsikko'])
+        workbook.active.append(list(mapper.table.columns))
+        for row in mapper.table.itertuples(index=False):
+            workbook.active.append([value or None for value in row])
+        workbook.active.append(['Yhteensä', len(mapper.table)])
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            destination = os.path.join(tempdir, 'prisoners.xlsx')
+            workbook.save(destination)
+
+            excel_mapper = RDFMapper(PRISONER_MAPPING, '')
+            excel_mapper.read_csv(destination, skip_header=1, skip_footer=1)
+
+        self.assertEqual(mapper.table.values.tolist(), excel_mapper.table.values.tolist())
+        self.assertEqual(list(mapper.table.columns), list(excel_mapper.table.columns))
+
+    def test_read_table_empty(self):
+        columns = list(read_table('test_data/prisoners.csv').columns)
+
+        for table in [read_table('test_data/prisoners.csv', nrows=0),
+                      read_table('test_data/prisoners.csv', skip_footer=5)]:
+            self.assertEqual(len(table), 0)
+            self.assertEqual(list(table.columns), columns)
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            destination = os.path.join(tempdir, 'prisoners.xlsx')
+            workbook = openpyxl.Workbook()
+            workbook.save(destination)
+            self.assertEqual(len(read_table(destination)), 0)
+
+            workbook.active.append(columns)
+            workbook.save(destination)
+            for chunksize in [None, 2]:
+                (table,) = read_chunks(destination, chunksize)
+                self.assertEqual(len(table), 0)
+                self.assertEqual(list(table.columns), columns)
+
+    def test_process_table_chunks(self):
+        instance_class = URIRef(SCHEMA_WARSA.PrisonerRecord)
+
+        mapper = self.prisoner_mapper()
+        mapper.process_rows()
+
+        chunked_mapper = RDFMapper(PRISONER_MAPPING, instance_class)
+        chunked_mapper.process_table_chunks('test_data/prisoners.csv', 2, chunked_mapper.process_rows)
+
+        assert isomorphic(mapper.data, chunked_mapper.data)
+        self.assertEqual(mapper.errors, chunked_mapper.errors)
+
+    def test_process_rows_cache(self):
+        instance_class = URIRef(SCHEMA_WARSA.PrisonerRecord)
+
+        mapper = self.prisoner_mapper()
+        mapper.process_rows()
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            cache_file = os.path.join(tempdir, 'rows.sqlite')
+
+            for (mapping, hits) in [(PRISONER_MAPPING, 0), (PRISONER_MAPPING, len(mapper.table)),
+                                    (dict(PRISONER_MAPPING, ammatti={'uri': SCHEMA_POW.occupation_literal}), 0)]:
+                cache = RowCache(cache_file, mapping, instance_class)
+                cached_mapper = self.prisoner_mapper(mapping, cache=cache)
+                cached_mapper.process_rows()
+                cache.close()
+
+                self.assertEqual(cache.hits, hits)
+                if mapping is PRISONER_MAPPING:
+                    assert isomorphic(mapper.data, cached_mapper.data)
+                    self.assertEqual(mapper.errors, cached_mapper.errors)
+
+    def test_process_rows_cache_header(self):
+        instance_class = URIRef(SCHEMA_WARSA.PrisonerRecord)
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            cache_file = os.path.join(tempdir, 'rows.sqlite')
+
+            for (swap, hits) in [(False, 0), (True, 0), (True, 2)]:
+                cache = RowCache(cache_file, PRISONER_MAPPING, instance_class)
+                cached_mapper = self.prisoner_mapper(cache=cache)
+                if swap:  # Same cells under renamed columns
+                    columns = list(cached_mapper.table.columns)
+                    (columns[4], columns[5]) = (columns[5], columns[4])
+                    cached_mapper.table.columns = columns
+                cached_mapper.process_rows()
+                cache.close()
+
+                self.assertEqual(cache.hits, hits)
+                self.assertEqual(cache.misses, len(cached_mapper.table) - hits)
+
+    def test_process_rows_graph_provenance(self):
+        mappers = {}
+        for provenance in ['reification', 'graphs']:
+            mappers[provenance] = self.prisoner_mapper(provenance=provenance)
+            mappers[provenance].process_rows()
+
+        self.assertLess(len(mappers['graphs'].data), len(mappers['reification'].data))
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            quads_file = os.path.join(tempdir, 'prisoners.trig')
+            triples_file = os.path.join(tempdir, 'prisoners.ttl')
+            mappers['graphs'].serialize(quads_file, os.path.join(tempdir, 'schema.ttl'))
+            mappers['graphs'].serialize(triples_file, os.path.join(tempdir, 'schema.ttl'))
+            expanded = read_graph(quads_file)
+            self.assertEqual(len(Graph().parse(triples_file, format='turtle')), len(expanded))
+
+        def annotations(graph):
+            return {(graph.value(statement, RDF.subject), graph.value(statement, RDF.predicate),
+                     graph.value(statement, RDF.object), frozenset(graph.objects(statement, DCT.source)))
+                    for statement in graph.subjects(RDF.type, RDF.Statement)}
+
+        reified = mappers['reification'].data
+        self.assertEqual(annotations(expanded), annotations(reified))
+        self.assertEqual(len(expanded), len(reified))
+
+    def test_convert_locations(self):
+        table = pd.DataFrame({'vankeuspaikan numero': ['1', None, None],
+                              'vankeuspaikka': ['Siestarjoki', 'Karhumäki', None],
+                              'toiminta-aika': ['1942-1944', ' ', None]})
+
+        g = Graph()
+        for triple in convert_locations(table, SCHEMA_WARSA.PowCamp, Namespace(DATA_NS['camp_']),
+                                        ['vankeuspaikan-numero', 'vankeuspaikka']):
+            g.add(triple)
+
+        self.assertEqual(set(g), {
+            (DATA_NS['camp_1'], RDF.type, SCHEMA_WARSA.PowCamp),
+            (DATA_NS['camp_1'], SCHEMA_POW.camp_id, Literal('1')),
+            (DATA_NS['camp_1'], SCHEMA_POW.captivity_location, Literal('Siestarjoki')),
+            (DATA_NS['camp_1'], SCHEMA_POW.time_of_operation, Literal('1942-1944')),
+            (DATA_NS['camp_karhumaki'], RDF.type, SCHEMA_WARSA.PowCamp),
+            (DATA_NS['camp_karhumaki'], SCHEMA_POW.captivity_location, Literal('Karhumäki')),
+        })
+
     def test_get_triple_reifications(self):
         g = Graph().parse('test_data/prisoners.ttl', format='turtle')
 
@@ -114,6 +386,153 @@ class TestRDFMapper(unittest.TestCase):
         source = g.value(ref_sub, DCT.source)
         self.assertEquals(source, Literal('mikrofilmi'))
 
+    def test_reification_index(self):
+        g = Graph().parse('test_data/prisoners.ttl', format='turtle')
+        index = ReificationIndex(g)
+
+        for triple in g.triples((DATA_NS.prisoner_2, None, None)):
+            assert isomorphic(get_triple_reifications(g, triple, index), get_triple_reifications(g, triple))
+
+        triple = (DATA_NS.prisoner_2, SCHEMA_POW.municipality_of_residence_literal, Literal('Hämeenlinna'))
+        (statement,) = set(get_triple_reifications(g, triple).subjects())
+        index.remove(triple)
+
+        self.assertNotIn(triple, g)
+        self.assertEqual(len(list(g.triples((statement, None, None)))), 0)
+        self.assertEqual(len(get_triple_reifications(g, triple, index)), 0)
+
+    def test_hide_personal_information(self):
+        g = Graph().parse('test_data/prisoners.ttl', format='turtle')
+        persons = [DATA_NS.prisoner_1, DATA_NS.prisoner_2]
+        common_name = g.value(DATA_NS.prisoner_2, SCHEMA_WARSA.family_name)
+        captivities = list(g.objects(DATA_NS.prisoner_1, SCHEMA_POW.captivity))
+        g.add((DATA_NS.prisoner_2, SCHEMA_WARSA.family_name, Literal('Öhman')))
+
+        g = hide_personal_information(g, persons, [str(common_name)])
+
+        self.assertEqual(list(g.objects(DATA_NS.prisoner_1, SCHEMA_WARSA.family_name)), [Literal('Nimi rajoitettu')])
+        self.assertEqual(list(g.objects(DATA_NS.prisoner_1, SKOS.prefLabel)), [Literal('Nimi rajoitettu')])
+        self.assertEqual(list(g.objects(DATA_NS.prisoner_2, SKOS.prefLabel)), [common_name])
+        for captivity in captivities:
+            self.assertEqual(set(g.objects(captivity, SKOS.prefLabel)),
+                             {Literal('Henkilön sotavankeus'), Literal('Person\'s captivity')})
+        for person in persons:
+            self.assertIsNone(g.value(person, SCHEMA_WARSA.date_of_birth))
+            self.assertEqual(set(g.subjects(RDF.subject, person)) &
+                             set(g.subjects(RDF.predicate, SCHEMA_WARSA.date_of_birth)), set())
+            self.assertEqual(g.value(person, SCHEMA_POW.personal_information_removed), Literal(True))
+
+    def test_hide_personal_information_quads(self):
+        g = Graph().parse('test_data/prisoners.ttl', format='turtle')
+        persons = [DATA_NS.prisoner_1, DATA_NS.prisoner_2]
+        statement = next(g.subjects(RDF.type, RDF.Statement))
+        triple = (g.value(statement, RDF.subject), g.value(statement, RDF.predicate), g.value(statement, RDF.object))
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            write_graph(g, os.path.join(tempdir, 'prisoners.trig'))
+            dataset = read_graph(os.path.join(tempdir, 'prisoners.trig'), expand=False)
+
+            self.assertIsInstance(dataset, ConjunctiveGraph)
+            self.assertEqual(len(list(dataset.subjects(RDF.type, RDF.Statement))), 0)
+            self.assertEqual(triple_sources(dataset, triple), triple_sources(g, triple))
+            self.assertTrue(triple_sources(dataset, triple))
+
+            g = hide_personal_information(g, persons, [], ReificationIndex(g))
+            dataset = hide_personal_information(dataset, persons, [], ReificationIndex(dataset))
+
+            self.assertEqual(set(dataset.objects(DATA_NS.prisoner_1, SCHEMA_WARSA.family_name)),
+                             {Literal('Nimi rajoitettu')})
+            for person in persons:
+                self.assertIsNone(dataset.value(person, SCHEMA_WARSA.date_of_birth))
+                self.assertEqual(set(dataset.contexts((person, SCHEMA_WARSA.date_of_birth, None))), set())
+
+            write_graph(dataset, os.path.join(tempdir, 'pruned.ttl'))
+            pruned = Graph().parse(os.path.join(tempdir, 'pruned.ttl'), format='turtle')
+
+        def annotations(graph):
+            return {(t, frozenset(triple_sources(graph, t))) for t in graph.triples((None, None, None))
+                    if (t[0], RDF.type, RDF.Statement) not in graph}
+
+        self.assertEqual(annotations(dataset), annotations(g))
+        self.assertEqual(annotations(pruned), annotations(g))
+
+    def test_fetch_common_names_snapshot(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            snapshot = os.path.join(tempdir, 'family_names.json')
+            with open(snapshot, 'w', encoding='UTF-8') as snapshot_file:
+                json.dump({'Virtanen': 5, 'Mäkinen': 2, 'Aho': 2}, snapshot_file)
+
+            common_names = fetch_common_names(['Mäkinen', 'Mäkinen', 'Aho', 'Lahti', 'Lahti', 'Lahti', 'Lahti'],
+                                              None, snapshot)
+
+        self.assertEqual(common_names, ['Mäkinen', 'Virtanen'])
+
+    def test_classify_persons(self):
+        g = Graph()
+        records = {
+            'recent': ('1.1.1900', ['1.1.1980']),
+            'unknown_death': ('1.1.1900', ['1.1.1940', 'tuntematon']),
+            'alive': ('15.10.1910', []),
+            'old': ('1.1.1900', ['1.1.1943', '1.1.1942']),
+            'born_early': ('29.9.1910', []),
+            'no_dates': (None, []),
+        }
+        for (name, (birth, deaths)) in records.items():
+            g.add((DATA_NS[name], RDF.type, SCHEMA_WARSA.PrisonerRecord))
+            if birth:
+                g.add((DATA_NS[name], SCHEMA_WARSA.date_of_birth, Literal(birth)))
+            for death in deaths:
+                g.add((DATA_NS[name], SCHEMA_POW.date_of_death, Literal(death)))
+
+        attributes = person_attributes(g)
+        self.assertEqual(attributes.loc[DATA_NS.old, 'death_dates'], 2)
+
+        classes = classify_persons(attributes, today=datetime.date(2020, 1, 1))
+        self.assertEqual(classes.to_dict(), {
+            DATA_NS.recent: 'died_recently',
+            DATA_NS.unknown_death: 'died_recently',
+            DATA_NS.alive: 'possibly_alive',
+            DATA_NS.old: 'died_long_ago',
+            DATA_NS.born_early: 'no_restrictions',
+            DATA_NS.no_dates: 'no_restrictions',
+        })
+
+        policy = dict(PRIVACY_POLICY, death_years=80, birth_cutoff=datetime.date(1900, 1, 1))
+        classes = classify_persons(attributes, policy, today=datetime.date(2020, 1, 1))
+        self.assertEqual(classes[DATA_NS.old], 'died_recently')
+        self.assertEqual(classes[DATA_NS.born_early], 'possibly_alive')
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            policy_file = os.path.join(tempdir, 'policy.json')
+            with open(policy_file, 'w') as f:
+                json.dump({'death_years': 80, 'birth_cutoff': '1900-01-01'}, f)
+            self.assertEqual(load_policy(policy_file), policy)
+
+            with open(policy_file, 'w') as f:
+                json.dump({'death_years': '80'}, f)
+            self.assertRaises(ValueError, load_policy, policy_file)
+
+    def test_convert_and_prune(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            snapshot = os.path.join(tempdir, 'family_names.json')
+            with open(snapshot, 'w', encoding='UTF-8') as snapshot_file:
+                json.dump({}, snapshot_file)
+
+            plain_file = os.path.join(tempdir, 'plain.ttl')
+            graph = convert_and_prune('test_data/prisoners.csv', os.path.join(tempdir, 'pruned.ttl'),
+                                      os.path.join(tempdir, 'schema.ttl'), plain_file, names_snapshot=snapshot,
+                                      policy=dict(PRIVACY_POLICY, death_years=200),
+                                      destination_errors=os.path.join(tempdir, 'errors.csv'))
+
+            pruned = Graph().parse(os.path.join(tempdir, 'pruned.ttl'), format='turtle')
+            plain = Graph().parse(plain_file, format='turtle')
+
+        assert isomorphic(graph, pruned)
+        self.assertEqual(set(pruned.subjects(SCHEMA_POW.hide_documents, Literal(True))),
+                         set(plain.subjects(RDF.type, SCHEMA_WARSA.PrisonerRecord)))
+        self.assertFalse(any(pruned.triples((None, SCHEMA_POW.cause_of_death, None))))
+        self.assertTrue(any(plain.triples((None, SCHEMA_POW.cause_of_death, None))))
+
     def test_prune_persons(self):
         g = Graph().parse('test_data/prisoners.ttl', format='turtle')
         g2 = prune_persons(g, "http://ldf.fi/warsa/sparql")
@@ -132,6 +551,26 @@ class TestRDFMapper(unittest.TestCase):
         mapper = RDFMapper({'column1': {}}, '')
         self.assertEquals(mapper.get_mapping('column1 (kesken)'), {})
 
+    def test_compile_plan(self):
+        mapper = RDFMapper(PRISONER_MAPPING, URIRef(SCHEMA_WARSA.PrisonerRecord))
+        plan = mapper.compile_plan(['syntymäaika', 'tuntematon sarake', 'kotikunta (kesken)', 'joukko-osasto'])
+
+        self.assertEqual([handler.column for handler in plan], ['syntymäaika', 'kotikunta (kesken)', 'joukko-osasto'])
+        self.assertEqual([handler.position for handler in plan], [0, 2, 3])
+        self.assertEqual(mapper.unmapped_columns, ['tuntematon sarake'])
+
+        self.assertEqual(plan[0].uri, SCHEMA_WARSA.date_of_birth)
+        self.assertEqual(plan[0].converter, converters.convert_dates)
+        self.assertEqual(plan[0].split('1.1.1920 / 2.2.1920'), ['1.1.1920', ' 2.2.1920'])
+        self.assertEqual(plan[0].reification_template, '{entity}_date_of_birth_{id}_reification_source')
+        self.assertIsNone(plan[2].split)
+        self.assertIsNone(plan[2].read)
+
+        self.assertIs(mapper.plan_for(pd.Index(['syntymäaika', 'tuntematon sarake', 'kotikunta (kesken)',
+                                                'joukko-osasto'])), plan)
+        self.assertEqual([handler.column for handler in mapper.plan_for(['joukko-osasto', 'syntymäaika'])],
+                         ['joukko-osasto', 'syntymäaika'])
+
 
 class TestPersonLinking(unittest.TestCase):
     maxDiff = None
@@ -216,5 +655,195 @@ class TestPersonLinking(unittest.TestCase):
         self.assertEqual(expected, pd, pformat(pd))
 
 
+class TestLinker(unittest.TestCase):
+    class CountingArpa:
+        def __init__(self):
+            self.queries = []
+
+        def query(self, value):
+            self.queries.append(value)
+            return [{'id': 'http://example.com/' + value}] if value != 'Tuntematon' else []
+
+    def test_link_distinct_values(self):
+        g = Graph()
+        for (num, camp) in enumerate(['Sorokka', ' Sorokka', 'Karhumäki', 'Tuntematon', 'Sorokka', '']):
+            g.add((DATA_NS['prisoner_%s' % num], SCHEMA_POW.location_literal, Literal(camp)))
+
+        arpa = self.CountingArpa()
+        results = {}
+        links = link(g, arpa, SCHEMA_POW.location_literal, Graph(), SCHEMA_POW.location, results=results)
+
+        self.assertEqual(sorted(arpa.queries), ['Karhumäki', 'Sorokka', 'Tuntematon'])
+        self.assertEqual(len(links), 4)
+        self.assertEqual(set(links.subjects(SCHEMA_POW.location, URIRef('http://example.com/Sorokka'))),
+                         {DATA_NS.prisoner_0, DATA_NS.prisoner_1, DATA_NS.prisoner_4})
+
+        links = link(g, arpa, SCHEMA_POW.location_literal, Graph(), SCHEMA_POW.location, results=results)
+        self.assertEqual(len(arpa.queries), 3)
+        self.assertEqual(len(links), 4)
+
+    def test_link_camps(self):
+        camps = Graph()
+        camps.add((DATA_NS.camp_1, SCHEMA_POW.captivity_location, Literal('Sorokka ven. Belomorsk')))
+        camps.add((DATA_NS.camp_2, SCHEMA_POW.camp_id, Literal('Karhumäki, evakuointipiste')))
+        camps.add((DATA_NS.camp_3, SCHEMA_POW.camp_id, Literal('Sairaala 3456')))
+
+        g = Graph()
+        for (num, camp) in enumerate(['Sorokka', 'KARHUMÄKI,  evakuointipiste', 'Sairaala 3456 (Kirov)',
+                                      'Tuntematon']):
+            g.add((DATA_NS['prisoner_%s' % num], SCHEMA_POW.location_literal, Literal(camp)))
+
+        links = link_camps(g, camps)
+
+        self.assertEqual(set(links), {(DATA_NS.prisoner_0, SCHEMA_POW.location, DATA_NS.camp_1),
+                                      (DATA_NS.prisoner_1, SCHEMA_POW.location, DATA_NS.camp_2),
+                                      (DATA_NS.prisoner_2, SCHEMA_POW.location, DATA_NS.camp_3)})
+
+    def test_person_model(self):
+        fields = [{'field': 'given', 'type': 'String'},
+                  {'field': 'birth_place', 'type': 'Custom', 'comparator': link, 'has missing': True}]
+        links = [('http://ldf.fi/warsa/prisoners/prisoner_1', 'http://ldf.fi/warsa/actors/person_1')]
+        prisoners = {'http://ldf.fi/warsa/prisoners/prisoner_1': {'given': 'Matti', 'birth_place': None}}
+        persons = {'http://ldf.fi/warsa/actors/person_1': {'given': 'Matti', 'birth_place': ['Sortavala']}}
+
+        fingerprint = model_fingerprint(fields, links, prisoners, persons, sample_size=100)
+        self.assertEqual(fingerprint, model_fingerprint(fields, list(links), dict(prisoners), persons, sample_size=100))
+        self.assertNotEqual(fingerprint, model_fingerprint(fields, [], prisoners, persons, sample_size=100))
+        self.assertNotEqual(fingerprint, model_fingerprint(fields[:1], links, prisoners, persons, sample_size=100))
+        self.assertNotEqual(fingerprint, model_fingerprint([fields[0], dict(fields[1], comparator=link_camps)], links,
+                                                           prisoners, persons, sample_size=100))
+        self.assertNotEqual(fingerprint, model_fingerprint(fields, links, prisoners, {}, sample_size=100))
+        self.assertNotEqual(fingerprint, model_fingerprint(fields, links, prisoners, persons, sample_size=200))
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            model_file = os.path.join(tempdir, 'model.pickle')
+            self.assertFalse(load_settings(dedupe.RecordLink(fields), model_file, fingerprint))
+
+            linker = dedupe.RecordLink(fields)
+            linker.predicates = ()
+            save_settings(linker, model_file, fingerprint)
+
+            loaded = dedupe.RecordLink(fields)
+            self.assertTrue(load_settings(loaded, model_file, fingerprint))
+            self.assertEqual(loaded.predicates, ())
+            self.assertFalse(load_settings(dedupe.RecordLink(fields), model_file,
+                                           model_fingerprint(fields, [], prisoners, persons, sample_size=100)))
+
+    def test_response_cache(self):
+        g = Graph()
+        g.add((DATA_NS.camp_1, SKOS.prefLabel, Literal('Sorokka')))
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            cache_file = os.path.join(tempdir, 'responses.sqlite')
+
+            cache = ResponseCache(cache_file)
+            arpa = cache_queries(self.CountingArpa(), cache, 'http://arpa', {'template': 'camps'})
+            self.assertEqual(arpa.query('Sorokka'), arpa.query('Sorokka'))
+            self.assertEqual(arpa.queries, ['Sorokka'])
+            assert isomorphic(cached_graph(cache, 'http://sparql', 'camps', lambda: g), g)
+            self.assertEqual(cache.cached('http://arpa', 'Sorokka', lambda: ['refreshed'], refresh=True), ['refreshed'])
+            self.assertEqual(cache.cached('http://arpa', 'Sorokka', lambda: ['stale']), ['refreshed'])
+            cache.close()
+
+            cache = ResponseCache(cache_file, replay=True)
+            arpa = cache_queries(self.CountingArpa(), cache, 'http://arpa', {'template': 'camps'})
+            self.assertEqual(arpa.query('Sorokka'), [{'id': 'http://example.com/Sorokka'}])
+            self.assertRaises(ReplayMiss, arpa.query, 'Karhumäki')
+            assert isomorphic(cached_graph(cache, 'http://sparql', 'camps', lambda: Graph()), g)
+            self.assertEqual(arpa.queries, [])
+
+            cache.invalidate('http://arpa')
+            self.assertRaises(ReplayMiss, arpa.query, 'Sorokka')
+            cache.close()
+
+            cache = ResponseCache(cache_file, ttl=0)
+            self.assertEqual(len(cached_graph(cache, 'http://sparql', 'camps', lambda: Graph())), 0)
+            cache.close()
+
+
+class TestQueryExecutor(unittest.TestCase):
+    """
+    Test queries against a local HTTP server that answers after a delay, failing the first request of each value
+    """
+
+    class Server(socketserver.ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            text = self.rfile.read(int(self.headers['Content-Length'])).decode('UTF-8')
+            server = self.server
+            with server.lock:
+                server.requests.append(text)
+                fail = text not in server.failed and 'text=fail' in text
+                server.failed.add(text)
+                server.active += 1
+                server.max_active = max(server.max_active, server.active)
+
+            time.sleep(server.delay)
+            with server.lock:
+                server.active -= 1
+
+            self.send_response(503 if fail or 'text=down' in text else 404 if 'text=missing' in text else 200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({'results': [{'id': text}]}).encode('UTF-8'))
+
+        def log_message(self, *args):
+            pass
+
+    def setUp(self):
+        self.server = self.Server(('127.0.0.1', 0), self.Handler)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.failed = set()
+        self.server.active = 0
+        self.server.max_active = 0
+        self.server.delay = 0.2
+        self.url = 'http://127.0.0.1:%s/arpa' % self.server.server_port
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def query(self, value, timeout=5):
+        response = requests.post(self.url, data={'text': value}, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def test_map(self):
+        executor = QueryExecutor(max_connections=4, retries=1, backoff=0.01)
+        start = time.time()
+        results = executor.map(self.query, ['a%s' % i for i in range(8)] + ['a0', 'fail'])
+        elapsed = time.time() - start
+
+        self.assertEqual(len(results), 9)
+        self.assertEqual(results['a3'], {'results': [{'id': 'text=a3'}]})
+        self.assertEqual(len(self.server.requests), 10)  # One retry
+        self.assertEqual(self.server.max_active, 4)
+        self.assertLess(elapsed, 9 * self.server.delay)
+
+    def test_errors(self):
+        executor = QueryExecutor(max_connections=2, retries=2, backoff=0.01)
+        self.assertRaises(requests.Timeout, executor.call, self.query, 'slow', timeout=0.1)
+        self.assertEqual(len(self.server.requests), 3)
+
+        self.assertRaises(requests.HTTPError, executor.call, self.query, 'down')
+        self.assertEqual(len(self.server.requests), 6)
+
+        self.assertRaises(requests.HTTPError, executor.call, self.query, 'missing')
+        self.assertEqual(len(self.server.requests), 7)
+
+    def test_timeout(self):
+        executor = QueryExecutor(max_connections=2, timeout=0.05, retries=1, backoff=0.01)
+        self.assertRaises(QueryTimeout, executor.call, self.query, 'stalled')
+        self.assertEqual(len(self.server.requests), 2)
+
+        executor.timeout = 1
+        self.assertEqual(executor.map(self.query, ['a', 'b']), {value: {'results': [{'id': 'text=' + value}]}
+                                                               for value in ['a', 'b']})
+
+
 if __name__ == '__main__':
     unittest.main()
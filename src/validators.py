@@ -5,11 +5,17 @@ Converters for CSV cell data
 """
 
 from datetime import date
+from functools import partial
 import logging
 
+import numpy as np
+import pandas as pd
+
 
 log = logging.getLogger(__name__)
 
+ERROR_COLUMNS = ['nro', 'nimi', 'sarake', 'virhe', 'arvo']
+
 
 def validate_dates(resolved, original, after=date(1939, 11, 28), before=date(1945, 4, 25)):
     """
@@ -52,3 +58,112 @@ def validate_mother_tongue(resolved, original):
         return 'Epäselvä arvo'
 
     return
+
+
+def error_frame(errors, original, column, numbers=None, names=None):
+    """
+    Build an error frame in the same layout as RDFMapper.write_errors.
+
+    :param errors: Series of error strings, None for valid values
+    :param original: Series of original values, aligned with errors
+    :param column: column name
+    :param numbers: Series of prisoner numbers, indexed like errors
+    :param names: Series of prisoner names, indexed like errors
+    :return: DataFrame with columns nro, nimi, sarake, virhe, arvo, containing only the erroneous values
+    """
+    mask = errors.notna().values
+    index = errors.index[mask]
+
+    return pd.DataFrame({
+        'nro': numbers.reindex(index).values if numbers is not None else None,
+        'nimi': names.reindex(index).values if names is not None else None,
+        'sarake': column,
+        'virhe': errors.values[mask],
+        'arvo': original.values[mask],
+    }, index=index, columns=ERROR_COLUMNS)
+
+
+def validate_dates_column(resolved, original, column='', numbers=None, names=None,
+                          after=date(1939, 11, 28), before=date(1945, 4, 25)):
+    """
+    Validate a column of resolved dates, like validate_dates.
+
+    :param resolved: Series of resolved dates (datetime.date, or str if the date could not be resolved)
+    :param original: Series of original date strings
+    :return: error frame
+    """
+    errors = pd.Series(None, index=resolved.index, dtype=object)
+    types = resolved.map(type)
+
+    is_str = (types == str).values & (resolved != '').values
+    invalid = (resolved[is_str].str[:2] != 'xx').values
+    errors[is_str] = np.where(invalid, 'Päivämäärä ei ole kelvollinen', None)
+
+    is_date = (types == date).values
+    dates = resolved[is_date]
+    too_early = (dates < after).values
+    too_late = (dates > before).values & ~too_early
+    date_strings = dates.astype(str).values
+    date_errors = np.full(len(dates), None, dtype=object)
+    date_errors[too_early] = 'Päivämäärä ' + date_strings[too_early] + ' liian varhainen (< %s)' % after
+    date_errors[too_late] = 'Päivämäärä ' + date_strings[too_late] + ' liian myöhäinen (> %s)' % before
+    errors[is_date] = date_errors
+
+    return error_frame(errors, original, column, numbers, names)
+
+
+def validate_person_name_column(resolved, original, column='sukunimi ja etunimet', numbers=None, names=None):
+    """
+    Validate a column of resolved person names, like validate_person_name.
+
+    :param resolved: Series of resolved names
+    :param original: Series of original names
+    :return: error frame
+    """
+    differs = (resolved.str.lower().values != original.str.lower().values)
+    errors = pd.Series(np.where(differs, 'Tulkittu nimi [' + resolved + '] poikkeaa alkuperäisestä', None),
+                       index=resolved.index)
+
+    return error_frame(errors, original, column, numbers, names)
+
+
+def validate_mother_tongue_column(resolved, original, column='', numbers=None, names=None):
+    """
+    Validate a column of mother tongue markings, like validate_mother_tongue.
+
+    :return: error frame
+    """
+    unclear = (original.str.strip() != '').values & (original.str.upper() != 'X').values
+    errors = pd.Series(np.where(unclear, 'Epäselvä arvo', None), index=original.index)
+
+    return error_frame(errors, original, column, numbers, names)
+
+
+COLUMN_VALIDATORS = {
+    validate_dates: validate_dates_column,
+    validate_person_name: validate_person_name_column,
+    validate_mother_tongue: validate_mother_tongue_column,
+}
+
+
+def column_validator(validator):
+    """
+    Get the column-level version of a validator. Keyword arguments of a partial validator are preserved.
+    Validators without a column-level version are applied to each value separately.
+
+    :param validator: validator function, or functools.partial of one
+    :return: function taking resolved and original Series, column name, prisoner numbers and names,
+             and returning an error frame
+    """
+    func, keywords = (validator.func, validator.keywords) if isinstance(validator, partial) and not validator.args \
+        else (validator, {})
+
+    if func in COLUMN_VALIDATORS:
+        return partial(COLUMN_VALIDATORS[func], **keywords)
+
+    def validate_column(resolved, original, column='', numbers=None, names=None):
+        errors = pd.Series([validator(value, orig) for value, orig in zip(resolved, original)],
+                           index=resolved.index, dtype=object)
+        return error_frame(errors, original, column, numbers, names)
+
+    return validate_column